@@ -4,6 +4,7 @@
 # import time
 # Пожалуйста, прочитайте документацию на QMC5883L!
 # Please read the QMC5883L documentation!
+import array
 import math
 # import sys
 from machine import I2C, Pin
@@ -23,53 +24,69 @@ if __name__ == '__main__':
     delay_func = time.sleep_us  # микросекунды!!!
 
     sensor = mmc5603mod.MMC5603(adapter)
-    print(f"Sensor id: {sensor.get_id()}")
-    print(16 * "_")
-    test_passed = sensor.perform_self_test()
-    print(f"Самопроверка пройдена: {test_passed}")
-    if not test_passed:
-        print(f"Самопроверка НЕ пройдена! Прекращаем работу! :-)")
-        # sys.exit(-1)
-    wt_after_reset_ms = 20
-    sensor.soft_reset()     # сбросил режим работы датчика
-    time.sleep_ms(wt_after_reset_ms)       # ожидаю, когда датчик придет в себя!
+    # Быстрый старт после пробуждения MCU из глубокого сна: если датчик уже настроен (снимок его состояния
+    # сохранен в файле), то самопроверка, программный сброс и демонстрация пропускаются!
+    state_file = "mmc5603.bin"
+    try:
+        with open(state_file, "rb") as f:
+            state = f.read()
+    except OSError:
+        state = None
+    fast = sensor.fast_start(state)
+    # FAST_START_RESTORED: датчик потерял настройки, они уже записаны из снимка, медленный путь не нужен
+    print(f"Быстрый старт: {fast}")
+    if mmc5603mod.FAST_START_FAILED == fast:
+        print(f"Sensor id: {sensor.get_id()}")
+        print(16 * "_")
+        test_passed = sensor.perform_self_test()
+        print(f"Самопроверка пройдена: {test_passed}")
+        if not test_passed:
+            print(f"Самопроверка НЕ пройдена! Прекращаем работу! :-)")
+            # sys.exit(-1)
+        wt_after_reset_ms = 20
+        sensor.soft_reset()     # сбросил режим работы датчика
+        time.sleep_ms(wt_after_reset_ms)       # ожидаю, когда датчик придет в себя!
 
-    print("Демонстрация измерения температуры!")
-    for _ in range(10):
-        print(f"Температура от датчика: {sensor.get_temperature()}")
-        time.sleep_ms(200)
+        print("Демонстрация измерения температуры!")
+        for _ in range(10):
+            print(f"Температура от датчика: {sensor.get_temperature()}")
+            time.sleep_ms(200)
 
-    print("Внимание! Включите плоттер и вращайте датчик!")
-    # режим измерений 'по запросу'
-    print("Внимание! Включите плоттер и вращайте датчик!")
-    print("Режим измерения 'по запросу!'")
-    _counter = 0
-    for _ in range(200):
-        sensor.start_measure(continuous_mode=False, auto_set_reset=True)
-        time.sleep_ms(100)
-        if sensor.is_data_ready():
-            axis = sensor.get_axis(-1)
-            print(f"X: {axis[0]}; Y: {axis[1]}; Z: {axis[2]};")
-        _counter += 1
-        if 0 == _counter % 10:
-            pass
+        print("Внимание! Включите плоттер и вращайте датчик!")
+        # режим измерений 'по запросу'
+        print("Внимание! Включите плоттер и вращайте датчик!")
+        print("Режим измерения 'по запросу!'")
+        block_len = 10
+        block = array.array('i', bytes(12 * block_len))   # X, Y, Z для block_len измерений
+        for _ in range(20):
+            sensor.read_block(block_len, block, auto_set_reset=True)
+            for i in range(0, 3 * block_len, 3):
+                print(f"X: {block[i]}; Y: {block[i + 1]}; Z: {block[i + 2]};")
+            time.sleep_ms(100)
 
-    sensor.soft_reset()  # сбросил режим работы датчика
-    time.sleep_ms(wt_after_reset_ms)  # ожидаю, когда датчик придет в себя!
-    # режим измерений 'непрерывный'
-    sensor.set_update_rate(20)
-    print(f"Частота обновления данных [Гц]: {sensor.get_update_rate()}")
-    print(f"bandwidth: {sensor.band_width}")
-    print("Непрерывный режим измерения!")
+        sensor.soft_reset()  # сбросил режим работы датчика
+        time.sleep_ms(wt_after_reset_ms)  # ожидаю, когда датчик придет в себя!
+        # режим измерений 'непрерывный'
+        sensor.set_update_rate(20)
+        print(f"Частота обновления данных [Гц]: {sensor.get_update_rate()}")
+        print(f"bandwidth: {sensor.band_width}")
+        print("Непрерывный режим измерения!")
+        sensor.start_measure(continuous_mode=True, auto_set_reset=True)
+        with open(state_file, "wb") as f:
+            f.write(sensor.get_state())     # для быстрого старта при следующем запуске
     wt = sensor.get_conversion_cycle_time()
     print(f"Время преобразования [мкс]: {wt}")
-    sensor.start_measure(continuous_mode=True, auto_set_reset=True)
     print(f"Это непрерывный режим измерения: {sensor.is_continuous_meas_mode()}")
     index = 0
     samples_count = 5000
+    first_sample = True
     for mf_comp in sensor:
         delay_func(wt)
         if mf_comp:
+            if first_sample:
+                # ticks_ms отсчитывается от загрузки MCU
+                print(f"Время от загрузки до первого отсчета [мс]: {time.ticks_ms()}")
+                first_sample = False
             x = math.sqrt(sum(map(lambda val: val ** 2, mf_comp)))  # Величина магнитного поля в условных ед.
             print(f"X: {mf_comp[0]}; Y: {mf_comp[1]}; Z: {mf_comp[2]}; Магнитное поле [усл. ед.]: {x}")
         index += 1
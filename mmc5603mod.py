@@ -1,5 +1,4 @@
 """MicroPython module for QMC5883L or HMC5883L Geomagnetic Sensor"""
-import micropython
 
 # The 1000 Hz ODR is available by writing 255 into Register ODR and setting hi_power to 1.
 import array
@@ -11,9 +10,18 @@ import array
 from sensor_pack import bus_service, geosensmod
 from sensor_pack.base_sensor import check_value, Iterator, TemperatureSensor
 import time
+try:
+    import micropython
+except ImportError:     # CPython, например шлюз с Linux. Смотри sensor_pack.i2c_dev
+    from sensor_pack.mpy_compat import micropython, time
 
 _meas_time_us = 6_600, 3_500, 2_000, 1_200
 _offset = -2 ** 19
+_state_version = 1  # версия формата снимка состояния. Смотри MMC5603.get_state
+# результаты MMC5603.fast_start
+FAST_START_FAILED = 0       # снимок неверен, датчик не настроен
+FAST_START_READY = 1        # датчик уже настроен согласно снимку
+FAST_START_RESTORED = 2     # настройки из снимка записаны в датчик (restore_config)
 
 
 @micropython.native
@@ -42,6 +50,21 @@ def _get_update_rate_limits(bandwidth: int, use_auto_set_reset: bool) -> tuple[i
         return 1, 255
 
 
+def _conversion_time_us(axis_count: int, bandwidth: int) -> int:
+    """Возвращает время измерения, мкс, по axis_count осям при заданной полосе пропускания bandwidth"""
+    return int(0.333 * axis_count * _meas_time_us[bandwidth])
+
+
+def _pick_bandwidth(update_rate: int, use_auto_set_reset: bool) -> int:
+    """Возвращает наименьшее значение bandwidth, пределы update_rate которого (_get_update_rate_limits)
+    включают update_rate. Если такого значения нет, то возвращает -1"""
+    for _bw in range(4):
+        lo, hi = _get_update_rate_limits(_bw, use_auto_set_reset)
+        if lo <= update_rate <= hi:
+            return _bw
+    return -1
+
+
 @micropython.native
 def axis_name_to_reg_addr(axis_name: int) -> tuple:
     """Функция-обертка. Преобразует имя оси 0('x'), 1('y'), 2('z')) в адрес соответствующего регистра"""
@@ -84,6 +107,15 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
         # не переключать в False, иначе датчик чувствительные элементы
         # датчика намагнитятся и ваши измерения будут неточны!!!
         self._periodical_set_en = True  # автоматическое выполнение do_set/do_reset во время измерений
+        # Истина, когда пороги самотестирования (регистры 0x1E..0x20) уже записаны в датчик.
+        # После программного сброса датчика пороги нужно записывать заново!
+        self._st_thresholds_valid = False
+        # Истина, когда запущено измерение 'по запросу' и его результат еще не готов
+        self._meas_pending = False
+        # обработчики результатов измерений, вызываемые из __next__. Смотри add_handler
+        self._handlers = []
+        # аргументы последнего вызова start_measure (continuous_mode, auto_set_reset). Смотри restore_config
+        self._last_start = None
         self.setup()
 
     @property
@@ -108,12 +140,9 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
         if 255 < update_rate != 1000:
             raise ValueError(error_msg)
         self._hi_power = 1000 == update_rate
-        _use_auto_set_reset = self.is_auto_set_reset
-
-        for _bw in range(4):
-            lo, hi = _get_update_rate_limits(_bw, _use_auto_set_reset)
-            if update_rate in range(lo, 1+hi):
-                return _bw, update_rate
+        _bw = _pick_bandwidth(update_rate, self.is_auto_set_reset)
+        if _bw >= 0:
+            return _bw, update_rate
 
         if 1000 == update_rate:
             return 3, 255
@@ -140,8 +169,9 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
             do_set: [bool, None] = False,  # bit 3. Запись 1 в этот бит приведет к тому, что чип выполнит операцию намагничивания, что позволит большому току намагничивания течь через катушки датчика в течение 375 нс. Этот бит автоматически очищается в конце операции намагничивания.
             tm_t: [bool, None] = False,  # bit 1. Запись 1 в этот бит заставляет чип выполнять измерение температуры. Этот бит самоочищается в конце каждого измерения.
             tm_m: [bool, None] = False,  # bit 0. Запись 1 в этот бит заставляет чип выполнять измерение магнитного поля. Этот бит самоочищается в конце каждого измерения.
-    ):
-        """Control 0 Register."""
+            write: bool = True,     # если Ложь, то значение только возвращается, без записи в датчик
+    ) -> int:
+        """Control 0 Register. Возвращает значение регистра."""
         val = 0     # self._read_reg_(0x1B)
         if cmm_freq_en is not None:
             val &= ~(1 << 7)  # mask
@@ -164,7 +194,9 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
         if tm_m is not None:
             val &= ~1  # mask
             val |= tm_m
-        self._write_reg(0x1B, val, 1)
+        if write:
+            self._write_reg(0x1B, val, 1)
+        return val
 
     def _control_1(
             self,
@@ -278,22 +310,33 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
     def do_set(self):
         """Выполняет операцию Set, что вызывает протекание тока через катушки датчика в течение 375 нс.
         Этот бит автоматически очищается в конце операции! Намагничивает!"""
-        self._control_0(do_set=True)
+        # бит auto_sr_en не самоочищается, поэтому записываю его текущее значение
+        self._control_0(auto_sr_en=self.is_auto_set_reset, do_set=True)
 
     def do_reset(self):
         """Выполняет операцию сброса, что вызывает протекание тока сброса(!) течь через катушки датчика
         в течение 375 нс. Этот бит автоматически очищается в конце операции сброса! Размагничивает!"""
-        self._control_0(do_reset=True)
+        self._control_0(auto_sr_en=self.is_auto_set_reset, do_reset=True)
+
+    def _apply_control_1(self, st_enp: bool = False, st_enm: bool = False):
+        """Записывает в Control 1 Register текущие настройки (bandwidth, оси измерений) и биты st_enp, st_enm.
+        Нужен для того, чтобы не сбрасывать настройки датчика в режиме периодических измерений!"""
+        _axis = self._axis_measurement
+        self._control_1(st_enm=st_enm, st_enp=st_enp,
+                        bandwidth=self._bandwidth,
+                        x_inhibit='x' not in _axis,
+                        y_inhibit='y' not in _axis,
+                        z_inhibit='z' not in _axis)
 
     def demagnetize(self, on_time_us: int = 500):
         """Размагничивание путем подачи тока через катушку самотестирования в разных направлениях"""
         try:
-            self._control_1(st_enp=True, st_enm=False)      # ток потек в одном направлении
+            self._apply_control_1(st_enp=True, st_enm=False)      # ток потек в одном направлении
             time.sleep_us(on_time_us)
-            self._control_1(st_enp=False, st_enm=True)      # ток потек в другом направлении
+            self._apply_control_1(st_enp=False, st_enm=True)      # ток потек в другом направлении
             time.sleep_us(on_time_us)
         finally:    # выключаю ток!
-            self._control_1(st_enp=False, st_enm=False)
+            self._apply_control_1(st_enp=False, st_enm=False)
 
     def _read_reg(self, reg_addr: int, bytes_count: int = 1) -> bytes:
         """Считывает значение из регистра по адресу регистра reg_addr"""
@@ -304,9 +347,11 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
         bo = self._get_byteorder_as_str()[0]
         self.adapter.write_register(self.address, reg_addr, value, bytes_count, bo)
 
-    def perform_self_test(self) -> bool:
-        """Самотестирование датчика. Если возвратит Истина, то проверка пройдена УСПЕШНО!
-        Алгоритм смотри в документации на стр. 14. 'EXAMPLE OF SELFTEST'"""
+    def _write_self_test_thresholds(self):
+        """Записывает пороги самотестирования (80 % от значений регистров 0x27..0x29) в регистры 0x1E..0x20.
+        Запись производится только один раз, до программного сброса датчика!"""
+        if self._st_thresholds_valid:
+            return
         # stored = self._read_reg(0x27, 3)    # read axis selftest set value (0x27, 0x28, 0x29)
         stored = self._buf_3
         adapt = self.adapter
@@ -314,14 +359,39 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
         for offs, val in enumerate(map(lambda x: 8 * x // 10, stored)):
             stored[offs] = val
         adapt.write_buf_to_mem(self.address, 0x1E, stored)  # записываю из буфера в датчик 3 байта
-        self._control_0(auto_st_en=True, tm_m=True)  # произвести самотестирование
-        time.sleep_ms(20)   # задержка для выполнения самопроверки
-        # Этот бит является индикатором прохождения самотестирования.
-        # Он остается False, если после самотестирования, датчик прошел проверку!
-        # То есть его измерительные катушки НЕ намагничены!
-        stat = self.get_status()
-        # значение бита Sat_sensor в регистре состояния
-        return 0 == stat[1]
+        self._st_thresholds_valid = True
+
+    def start_self_test(self):
+        """Запускает самотестирование датчика и сразу возвращает управление, без ожидания!
+        В режиме 'по запросу' самотестирование выполняется вместе с измерением магнитного поля,
+        в непрерывном режиме - при очередном периодическом измерении.
+        Результат читай методом is_saturated после завершения измерения."""
+        self._write_self_test_thresholds()
+        _cmm = self._cmm
+        self._control_0(auto_st_en=True, auto_sr_en=self.is_auto_set_reset, tm_m=not _cmm)
+
+    def is_saturated(self) -> bool:
+        """Возвращает значение бита Sat_sensor в регистре состояния.
+        Этот бит является индикатором прохождения самотестирования.
+        Он остается False, если после самотестирования, датчик прошел проверку!
+        То есть его измерительные катушки НЕ намагничены!"""
+        return self.get_status()[1]
+
+    def get_self_test_time_us(self) -> int:
+        """Возвращает время (мкс) от вызова start_self_test, через которое можно читать результат самотестирования.
+        В непрерывном режиме самотестирование выполняется при очередном периодическом измерении!"""
+        wt = self.get_conversion_cycle_time()
+        if self._cmm:
+            return wt + 1_000_000 // self.get_update_rate()
+        return wt
+
+    def perform_self_test(self) -> bool:
+        """Самотестирование датчика. Если возвратит Истина, то проверка пройдена УСПЕШНО!
+        Алгоритм смотри в документации на стр. 14. 'EXAMPLE OF SELFTEST'"""
+        self.start_self_test()  # произвести самотестирование
+        # задержка для выполнения самопроверки. не менее 20 мс
+        time.sleep_us(max(20_000, self.get_self_test_time_us()))
+        return not self.is_saturated()
 
     def get_id(self):
         """Возвращает значение (Chip ID), которое равно 0x10!"""
@@ -342,6 +412,10 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
     def soft_reset(self):
         # software reset
         self._write_reg(reg_addr=0x1C, value=0b1000_0000)
+        self._cmm = False
+        self._meas_pending = False
+        # после сброса все регистры очищены, в том числе пороги самотестирования!
+        self._st_thresholds_valid = False
 
     def is_continuous_meas_mode(self) -> bool:
         """Возвращает Истина, когда включен режим периодических измерений!"""
@@ -349,8 +423,17 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
         return self._cmm
 
     def in_standby_mode(self) -> bool:
-        """Возвращает Истина, когда включен режим ожидания(экономичный режим)!"""
-        return False
+        """Возвращает Истина, когда включен режим ожидания(экономичный режим)!
+        Датчик находится в режиме ожидания, когда не включен режим периодических измерений
+        и не выполняется измерение 'по запросу'."""
+        return not self._cmm and not self._meas_pending
+
+    def standby(self):
+        """Выключает режим периодических измерений. Датчик переходит в режим ожидания(экономичный режим)!"""
+        self._write_reg(0x1A, 0x00, 1)     # ODR
+        self._control_2(hi_power=False, cmm_en=False, en_prd_set=False)
+        self._cmm = False
+        self._meas_pending = False
 
     def get_status(self) -> tuple:
         """Возвращает кортеж битов(номер бита): OTP_read_done(4), Sat_sensor(5), Meas_m_done(6), Meas_t_done(7)"""
@@ -362,7 +445,10 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
     def is_data_ready(self) -> bool:
         """Возвращает флаг Data Ready.
         This bit indicates that a measurement of magnetic field is done and the data is ready to be read."""
-        return self.get_status()[2]
+        ready = self.get_status()[2]
+        if ready:
+            self._meas_pending = False
+        return ready
 
     def start_measure(self, continuous_mode: bool = True, auto_set_reset: bool = True):
         """Запускает периодические измерения (continuous_mode is True) или измерение по запросу
@@ -378,12 +464,8 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
         self._control_0(cmm_freq_en=1)
         if continuous_mode:
             time.sleep_ms(10)   # ожидание завершения датчиком расчетов!
-        _axis = self._axis_measurement
         # self._control_0(auto_sr_en=auto_set_reset, tm_m=not continuous_mode)
-        self._control_1(bandwidth=self._bandwidth,
-                        x_inhibit='x' not in _axis,
-                        y_inhibit='y' not in _axis,
-                        z_inhibit='z' not in _axis)
+        self._apply_control_1()
         # if continuous_mode:
         self._control_2(hi_power=self._hi_power,
                         en_prd_set=self._periodical_set_en,
@@ -392,6 +474,88 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
         self._control_0(auto_sr_en=auto_set_reset, tm_m=not continuous_mode)
         # сохраняю режим измерений
         self._cmm = continuous_mode
+        self._meas_pending = not continuous_mode
+        self._last_start = continuous_mode, auto_set_reset
+
+    def _wait_data_ready(self, timeout_us: int) -> bool:
+        """Ожидает готовности результата измерения не более timeout_us мкс. Возвращает Истина, если данные готовы"""
+        step = 1 + timeout_us // 10
+        for _ in range(11):
+            if self.is_data_ready():
+                return True
+            time.sleep_us(step)
+        return False
+
+    def get_state(self) -> bytes:
+        """Возвращает снимок настроек датчика, записанных в него методами этого класса (управляющие
+        регистры датчика доступны только для записи!). Снимок сохраняется приложением, например, в файл,
+        и передается в fast_start после пробуждения MCU из глубокого сна."""
+        axis_mask = sum(1 << i for i, a in enumerate('xyz') if a in self._axis_measurement)
+        start = 0
+        if self._last_start is not None:
+            cmm, auto_sr = self._last_start
+            start = 1 + cmm + 2 * auto_sr   # 1..4, 0 - start_measure не вызывался
+        return bytes((_state_version, self._update_rate, self._bandwidth, self._hi_power, axis_mask,
+                      self._periodical_set_en, self._do_set_execute_period, start, self._st_thresholds_valid))
+
+    def set_state(self, state: bytes):
+        """Восстанавливает поля экземпляра класса из снимка get_state. Обмена с датчиком по шине нет!"""
+        if state is None or 9 != len(state) or _state_version != state[0]:
+            raise ValueError("Invalid state snapshot!")
+        # поля проверяются до присваивания: поврежденный снимок не должен изменить состояние экземпляра
+        check_value(state[1], range(1, 256), f"Invalid update rate in state snapshot: {state[1]}")
+        check_value(state[2], range(4), f"Invalid bandwidth in state snapshot: {state[2]}")
+        check_value(state[4], range(1, 8), f"Invalid axis mask in state snapshot: {state[4]}")
+        check_value(state[6], range(8), f"Invalid set execute period in state snapshot: {state[6]}")
+        check_value(state[7], range(5), f"Invalid start mode in state snapshot: {state[7]}")
+        self._update_rate, self._bandwidth = state[1], state[2]
+        self._hi_power = bool(state[3])
+        self._axis_measurement = ''.join(a for i, a in enumerate('xyz') if state[4] & (1 << i))
+        self._periodical_set_en = bool(state[5])
+        self._do_set_execute_period = state[6]
+        start = state[7]
+        self._last_start = None if 0 == start else (bool((start - 1) & 1), bool((start - 1) & 2))
+        # признак записанных порогов самотестирования из снимка не восстанавливается: после сбоя питания
+        # датчика пороги утрачены. Смотри fast_start
+        self._st_thresholds_valid = False
+
+    def fast_start(self, state: [bytes, None]) -> int:
+        """Быстрый старт по снимку состояния state (смотри get_state), без самотестирования и программного сброса.
+        Возвращает:
+        FAST_START_READY - датчик уже настроен (ответил верным ID, а в непрерывном режиме выдает новые данные),
+        обмен с датчиком этим ограничивается;
+        FAST_START_RESTORED - датчик не настроен, настройки из снимка записаны в датчик (restore_config);
+        FAST_START_FAILED - снимок неверен, с датчиком ничего не делается!
+        В обоих первых случаях можно сразу переходить к измерениям."""
+        try:
+            self.set_state(state)
+        except ValueError:
+            return FAST_START_FAILED
+        if self._last_start is None:
+            return FAST_START_FAILED
+        cmm = self._last_start[0]
+        self._cmm = cmm
+        if 0x10 == self.get_id():
+            if not cmm:
+                # в режиме 'по запросу' настройки записываются при каждом измерении
+                return FAST_START_READY
+            # ожидание нового результата не более двух периодов обновления
+            if self._wait_data_ready(self.get_conversion_cycle_time() + 2_000_000 // self.get_update_rate()):
+                # новые данные доказывают, что питание датчика не прерывалось и пороги сохранились
+                self._st_thresholds_valid = bool(state[8])
+                return FAST_START_READY
+        self.restore_config()
+        return FAST_START_RESTORED
+
+    def restore_config(self) -> bool:
+        """Повторно записывает в датчик настройки последнего вызова start_measure, например, после потери
+        датчиком настроек из-за сбоя питания. Возвращает Ложь, если start_measure еще не вызывался."""
+        if self._last_start is None:
+            return False
+        # пороги самотестирования могли быть утрачены вместе с настройками
+        self._st_thresholds_valid = False
+        self.start_measure(*self._last_start)
+        return True
 
     def read_raw(self, axis_name: int) -> int:
         """16, 18, 20 bits operation mode"""
@@ -401,29 +565,63 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
         # ret
         return _bytes_to_raw(bts)
 
-    def _get_all_meas_result(self) -> tuple:
-        # чтение всех данных!
+    def _decode_meas_result(self, buf9, out, offset: int):
+        """Преобразует 9 байт результата измерения buf9 в значения X, Y, Z и записывает их в out,
+        начиная с индекса offset"""
         b = self._buf_3
-        res = self._res
-        buf9 = self._buf_9
-        #
-        self.adapter.read_buf_from_mem(self.address, 0, buf9)       # 3x(3x8) bit value
         for axis in range(3):
             addresses = axis_name_to_reg_addr(axis)
             b[0] = buf9[addresses[0]]
             b[1] = buf9[1 + addresses[0]]
             b[2] = buf9[addresses[1]]
-            res[axis] = _bytes_to_raw(b)
+            out[offset + axis] = _bytes_to_raw(b)
+
+    def _get_all_meas_result(self) -> tuple:
+        # чтение всех данных!
+        res = self._res
+        buf9 = self._buf_9
+        #
+        self.adapter.read_buf_from_mem(self.address, 0, buf9)       # 3x(3x8) bit value
+        self._decode_meas_result(buf9, res, 0)
         #
         return tuple(res)
 
+    def read_block(self, n: int, out, auto_set_reset: bool = True) -> int:
+        """Выполняет n измерений 'по запросу' подряд и записывает результаты в out (например, array('i'),
+        длиной не менее 3 * n) в порядке: x0, y0, z0, x1, y1, z1, ... Возвращает n.
+        Управляющие регистры записываются один раз, затем для каждого измерения записывается только бит tm_m
+        и ожидается время преобразования (get_conversion_cycle_time). Настройки bandwidth и осей измерений
+        должны быть установлены до вызова!"""
+        if len(out) < 3 * n:
+            raise ValueError(f"Output buffer is too small: {len(out)}")
+        self.is_auto_set_reset = auto_set_reset
+        self._write_reg(0x1A, 0x00, 1)     # ODR
+        self._apply_control_1()
+        self._control_2(hi_power=False, en_prd_set=self._periodical_set_en, cmm_en=False,
+                        prd_set=self.set_execute_period)
+        self._cmm = False
+        self._last_start = False, auto_set_reset
+        wt = self.get_conversion_cycle_time()
+        adapt, addr, buf9 = self.adapter, self.address, self._buf_9
+        cmd = self._control_0(auto_sr_en=auto_set_reset, tm_m=True, write=False)
+        bo = self._get_byteorder_as_str()[0]
+        for i in range(n):
+            adapt.write_register(addr, 0x1B, cmd, 1, bo)
+            self._meas_pending = True
+            time.sleep_us(wt)
+            if not self._wait_data_ready(wt):
+                raise OSError("MMC5603: measurement timeout!")
+            adapt.read_buf_from_mem(addr, 0, buf9)
+            self._decode_meas_result(buf9, out, 3 * i)
+        return n
+
     def get_conversion_cycle_time(self) -> int:
         """Возвращает время, в микросекундах(!), преобразования датчиком в зависимости от его настроек.
         перед вызовом этого метода должен быть вызван метод set_update_rate !!!
         Если измерения по одной из осей (например х) отсутствуют, то общее время цикла измерения уменьшается на 1/3"""
         _axis = self._axis_measurement
         _bw = self._bandwidth
-        return int(0.333 * len(_axis) * _meas_time_us[_bw])
+        return _conversion_time_us(len(_axis), _bw)
 
     @property
     def band_width(self) -> int:
@@ -431,14 +629,416 @@ class MMC5603(geosensmod.GeoMagneticSensor, Iterator, TemperatureSensor):
         Биты выбора полосы пропускания регулируют длину прореживающего фильтра. Из документации"""
         return self._bandwidth
 
+    @band_width.setter
+    def band_width(self, value: int):
+        """Устанавливает bandwidth без изменения частоты обновления. Используется в режиме 'по запросу'"""
+        self._bandwidth = check_value(value, range(4), f"Invalid bandwidth value: {value}")
+
     def setup(self):
         pass
 
+    def add_handler(self, handler):
+        """Добавляет обработчик результатов измерений. handler вызывается из __next__ с кортежем X, Y, Z.
+        Например, экземпляр sensor_pack.trigger.EventCapture."""
+        self._handlers.append(handler)
+
+    def remove_handler(self, handler):
+        """Удаляет обработчик результатов измерений"""
+        self._handlers.remove(handler)
+
     def __iter__(self):
         return self
 
     def __next__(self):
         """возвращает результат только в режиме периодических измерений!"""
         if self.is_continuous_meas_mode and self.is_data_ready():
-            return self.get_axis(-1)
+            result = self.get_axis(-1)
+            for handler in self._handlers:
+                handler(result)
+            return result
+        return None
+
+
+class HealthMonitor:
+    """Фоновый контроль исправности датчика MMC5603 в режиме периодических измерений.
+    Периодически, без задержек(!), запускает автоматическое самотестирование датчика и, если бит Sat_sensor
+    после него установлен, выполняет do_set, а при повторении неудачи - demagnetize.
+    Метод poll нужно вызывать в паузах между отсчетами, сразу после чтения очередного результата измерения."""
+
+    def __init__(self, sensor: MMC5603, self_test_period_ms: int = 60_000, demagnetize_after: int = 3):
+        """sensor - датчик.
+        self_test_period_ms - период запуска самотестирования, мс.
+        demagnetize_after - количество неудачных самотестирований подряд, после которого выполняется demagnetize."""
+        check_value(demagnetize_after, range(1, 256), f"Invalid demagnetize_after value: {demagnetize_after}")
+        self._sensor = sensor
+        self._period_ms = self_test_period_ms
+        self._demagnetize_after = demagnetize_after
+        self._last_test = time.ticks_ms()   # время запуска последнего самотестирования
+        self._test_started = 0      # время (мкс) запуска ожидающего результата самотестирования
+        self._test_pending = False
+        self._sat_in_row = 0        # количество подряд неудачных самотестирований
+        self._retest = False        # Истина - повторить самотестирование немедленно
+        # счетчики
+        self.self_test_count = 0
+        self.self_test_failures = 0
+        self.saturation_count = 0
+        self.demagnetize_count = 0
+        # результат последнего самотестирования. None - самотестирование еще не выполнялось
+        self.last_self_test_ok = None
+
+    def _on_failed_self_test(self):
+        """Реакция на неудачное самотестирование (бит Sat_sensor установлен): do_set, а после demagnetize_after
+        неудач подряд - demagnetize. После каждого действия самотестирование повторяется немедленно.
+        Если и после demagnetize проверка не пройдена, то следующая - по расписанию."""
+        sen = self._sensor
+        self._sat_in_row += 1
+        if self._sat_in_row < self._demagnetize_after:
+            sen.do_set()
+            self._retest = True
+        elif self._sat_in_row == self._demagnetize_after:
+            sen.demagnetize()
+            self.demagnetize_count += 1
+            self._retest = True
+
+    def poll(self) -> bool:
+        """Выполняет один шаг контроля исправности датчика. Регистр состояния читается только тогда,
+        когда готов результат запущенного самотестирования, так как бит Sat_sensor отражает результат
+        самотестирования и не изменяется до следующего!
+        Возвращает Ложь, если последнее самотестирование не пройдено."""
+        sen = self._sensor
+        if self._test_pending:
+            if time.ticks_diff(time.ticks_us(), self._test_started) < sen.get_self_test_time_us():
+                return self.last_self_test_ok is not False      # результат еще не готов
+            self._test_pending = False
+            saturated = sen.is_saturated()
+            self.self_test_count += 1
+            self.last_self_test_ok = not saturated
+            if saturated:
+                self.self_test_failures += 1
+                self.saturation_count += 1
+                self._on_failed_self_test()
+            else:
+                self._sat_in_row = 0
+        now = time.ticks_ms()
+        if not self._test_pending:
+            scheduled = time.ticks_diff(now, self._last_test) >= self._period_ms
+            if scheduled or self._retest:
+                if scheduled:
+                    self._last_test = now
+                    self._sat_in_row = 0    # новая последовательность реакций на неудачи
+                self._retest = False
+                sen.start_self_test()
+                self._test_started = time.ticks_us()
+                self._test_pending = True
+        return self.last_self_test_ok is not False
+
+
+class DutyCycleScheduler(Iterator):
+    """Планировщик измерений с чередованием пачек (burst) измерений 'по запросу' и пауз, во время которых
+    датчик находится в режиме ожидания. Выбирает bandwidth для заданной средней частоты отсчетов (с наименьшим шумом
+или с наименьшей энергией на отсчет, смотри low_energy) и оценивает
+    энергию, затрачиваемую датчиком на один отсчет. Позволяет обменять задержку на время работы от батареи.
+    Итерация по экземпляру возвращает кортеж X, Y, Z, ожидая наступления времени очередного отсчета!"""
+
+    def __init__(self, sensor: MMC5603, sample_rate: float, burst_len: int = 1, axis: str = 'xyz',
+                 idle_func=None, supply_voltage: float = 3.3,
+                 active_current_ua: tuple = None, standby_current_ua: float = None,
+                 min_bandwidth: int = 0, max_bandwidth: int = 3, low_energy: bool = False):
+        """sensor - датчик.
+        sample_rate - средняя частота отсчетов, Гц. Может быть меньше 1.
+        burst_len - количество измерений в пачке, выполняемых подряд.
+        axis - оси измерений ('xyz', 'xy', 'yz' ...). Ненужные оси отключаются, что сокращает время измерения.
+        idle_func - функция ожидания, принимающая время в мс. Например machine.lightsleep. По умолчанию time.sleep_ms.
+        supply_voltage - напряжение питания датчика, В.
+        active_current_ua - кортеж из четырех значений тока потребления во время измерения, мкА,
+        для bandwidth 0, 1, 2, 3. standby_current_ua - ток потребления в режиме ожидания, мкА.
+        Эти значения берутся из таблицы 'Electrical Characteristics' документации на MMC5603NJ
+        (для вашей ревизии датчика) и нужны только для оценки энергии (get_energy_per_sample,
+        get_average_current). Драйвер не содержит значений по умолчанию, чтобы не выдавать оценки,
+        не подтвержденные документацией!
+        min_bandwidth, max_bandwidth - пределы bandwidth, из которых планировщик выбирает значение.
+        low_energy - выбор между шумом и энергией. Если Ложь (по умолчанию), то выбирается наименьший bandwidth
+        (наименьший шум), при котором укладывается пачка измерений. Время измерения при этом наибольшее, поэтому
+        энергия на отсчет тоже наибольшая (при bandwidth 0 - в несколько раз больше, чем при bandwidth 3)!
+        Если Истина, то выбирается bandwidth с наименьшей энергией на отсчет (по active_current_ua, если
+        задан, иначе наибольший, с наименьшим временем измерения)."""
+        check_value(burst_len, range(1, 65536), f"Invalid burst_len value: {burst_len}")
+        check_value(min_bandwidth, range(4), f"Invalid min_bandwidth value: {min_bandwidth}")
+        check_value(max_bandwidth, range(min_bandwidth, 4), f"Invalid max_bandwidth value: {max_bandwidth}")
+        if sample_rate <= 0:
+            raise ValueError(f"Invalid sample rate: {sample_rate}")
+        self._sensor = sensor
+        self._burst_len = burst_len
+        self._axis = axis
+        self._idle = idle_func if idle_func else time.sleep_ms
+        self._voltage = supply_voltage
+        if active_current_ua is not None and 4 != len(active_current_ua):
+            raise ValueError("active_current_ua must contain 4 values (bandwidth 0..3)!")
+        self._active_ua = active_current_ua
+        self._standby_ua = standby_current_ua
+        # период следования пачек измерений, мкс
+        self._burst_period_us = int(1_000_000 * burst_len / sample_rate)
+        self._bandwidth = self._select_bandwidth(min_bandwidth, max_bandwidth, low_energy)
+        self._index = 0         # номер измерения в пачке
+        self._next_burst = 0    # время начала следующей пачки измерений, мкс
+        self._block = array.array('i', bytes(12 * burst_len))     # результаты пачки измерений
+
+    def _select_bandwidth(self, min_bw: int, max_bw: int, low_energy: bool) -> int:
+        """Выбирает bandwidth из min_bw..max_bw, при котором пачка измерений занимает не более половины периода
+        следования пачек: наименьший (наименьший шум) или, если low_energy, с наименьшей энергией на отсчет."""
+        budget = self._burst_period_us // (2 * self._burst_len)
+        _cnt = len(self._axis)
+        fits = [bw for bw in range(min_bw, 1 + max_bw) if _conversion_time_us(_cnt, bw) <= budget]
+        if not fits:
+            if _conversion_time_us(_cnt, max_bw) > 2 * budget:
+                raise ValueError("The sample rate is too high for on-demand measurements!")
+            return max_bw
+        if not low_energy:
+            return fits[0]
+        if self._active_ua is None or self._standby_ua is None:
+            return fits[-1]
+        best = fits[0]
+        for bw in fits:
+            if self._energy_per_sample(bw) < self._energy_per_sample(best):
+                best = bw
+        return best
+
+    @property
+    def band_width(self) -> int:
+        """Значение bandwidth, выбранное планировщиком"""
+        return self._bandwidth
+
+    def get_conversion_cycle_time(self) -> int:
+        """Время одного измерения, мкс"""
+        return _conversion_time_us(len(self._axis), self._bandwidth)
+
+    def get_duty_cycle(self) -> float:
+        """Доля времени, в течение которой датчик выполняет измерения"""
+        return self._burst_len * self.get_conversion_cycle_time() / self._burst_period_us
+
+    def _get_currents(self) -> tuple:
+        """Возвращает ток потребления во время измерения при выбранном bandwidth и в режиме ожидания, мкА"""
+        if self._active_ua is None or self._standby_ua is None:
+            raise ValueError("Supply current values from the datasheet are not set!")
+        return self._active_ua[self._bandwidth], self._standby_ua
+
+    def _energy_per_sample(self, bandwidth: int) -> float:
+        """Оценка энергии на один отсчет при bandwidth, нДж"""
+        active, standby = self._active_ua[bandwidth], self._standby_ua
+        t_meas = _conversion_time_us(len(self._axis), bandwidth)
+        t_idle = self._burst_period_us / self._burst_len - t_meas
+        # мкА * мкс = пКл; пКл * В = пДж
+        return 0.001 * self._voltage * (active * t_meas + standby * t_idle)
+
+    def get_energy_per_sample(self) -> float:
+        """Возвращает оценку энергии, затрачиваемой датчиком на один отсчет при выбранном bandwidth, нДж"""
+        self._get_currents()    # проверка наличия значений тока потребления
+        return self._energy_per_sample(self._bandwidth)
+
+    def get_average_current(self) -> float:
+        """Возвращает оценку среднего тока потребления датчика, мкА"""
+        active, standby = self._get_currents()
+        d = self.get_duty_cycle()
+        return active * d + standby * (1 - d)
+
+    def configure(self):
+        """Сбрасывает датчик, устанавливает выбранные bandwidth и оси измерений, переводит датчик в режим ожидания.
+        Вызывается один раз, перед итерацией!"""
+        sen = self._sensor
+        sen.soft_reset()
+        time.sleep_ms(20)       # время включения датчика после программного сброса
+        sen.band_width = self._bandwidth
+        sen.axis_measurement = self._axis
+        sen.standby()
+        self._index = 0
+        self._next_burst = time.ticks_us()
+
+    def _wait_until(self, deadline_us: int):
+        """Ожидание до момента времени deadline_us. Большие интервалы - функцией idle_func"""
+        remain = time.ticks_diff(deadline_us, time.ticks_us())
+        if remain >= 2_000:
+            self._idle(remain // 1_000)
+            remain = time.ticks_diff(deadline_us, time.ticks_us())
+        if remain > 0:
+            time.sleep_us(remain)
+
+    def __next__(self) -> tuple:
+        sen = self._sensor
+        if 0 == self._index:
+            if time.ticks_diff(time.ticks_us(), self._next_burst) > self._burst_period_us:
+                self._next_burst = time.ticks_us()  # отстали от расписания больше, чем на период
+            self._wait_until(self._next_burst)      # датчик в режиме ожидания
+            self._next_burst = time.ticks_add(self._next_burst, self._burst_period_us)
+            sen.read_block(self._burst_len, self._block, sen.is_auto_set_reset)
+        offs = 3 * self._index
+        self._index += 1
+        if self._index >= self._burst_len:
+            self._index = 0
+        return tuple(self._block[offs:offs + 3])
+
+
+# ступени частоты обновления данных, Гц, между которыми переключается OdrGovernor
+_odr_steps = 1, 2, 5, 10, 20, 50, 75, 100, 150, 255
+
+
+class OdrGovernor:
+    """Регулятор частоты обновления данных (ODR) и bandwidth датчика в режиме периодических измерений.
+    Оценивает скорость изменения магнитного поля (сумма модулей приращений по осям, в 'сырых' единицах в секунду).
+    При быстром изменении поля сразу устанавливает максимальную частоту, чтобы не пропустить событие,
+    а после hold_ms 'тишины' понижает частоту на одну ступень. Это снижает нагрузку на шину и CPU
+    во время длительных пауз."""
+
+    def __init__(self, sensor: MMC5603, rise_threshold: int, fall_threshold: int,
+                 min_rate: int = 1, max_rate: int = 255, hold_ms: int = 5_000, smooth_shift: int = 2,
+                 max_bandwidth: int = 3):
+        """sensor - датчик в режиме периодических измерений.
+        rise_threshold - скорость изменения поля, выше которой частота повышается до максимальной.
+        fall_threshold - скорость изменения поля, ниже которой частота понижается.
+        min_rate, max_rate - пределы частоты обновления, Гц.
+        max_bandwidth - наибольшее допустимое значение bandwidth (0..3). Меньшее значение bandwidth - больше
+        время измерения и меньше шум. Используются только те ступени частоты, для которых set_update_rate
+        выберет bandwidth не больше max_bandwidth (смотри _get_update_rate_limits)!
+        hold_ms - время, в течение которого скорость изменения поля должна быть ниже fall_threshold.
+        smooth_shift - степень сглаживания (экспоненциальное среднее с коэффициентом 1/2**smooth_shift)."""
+        if fall_threshold >= rise_threshold:
+            raise ValueError(f"Invalid thresholds: {fall_threshold}, {rise_threshold}")
+        check_value(smooth_shift, range(8), f"Invalid smooth_shift value: {smooth_shift}")
+        check_value(max_bandwidth, range(4), f"Invalid max_bandwidth value: {max_bandwidth}")
+        _auto_sr = sensor.is_auto_set_reset
+        steps = tuple(r for r in _odr_steps
+                      if min_rate <= r <= max_rate and 0 <= _pick_bandwidth(r, _auto_sr) <= max_bandwidth)
+        if not steps:
+            raise ValueError(f"Invalid update rate limits: {min_rate}, {max_rate}")
+        self._sensor = sensor
+        self._steps = steps
+        self._rise = rise_threshold
+        self._fall = fall_threshold
+        self._hold_ms = hold_ms
+        self._shift = smooth_shift
+        self._prev = array.array('i', (0, 0, 0))
+        self._has_prev = False
+        self._rate_of_change = 0    # сглаженная скорость изменения поля
+        self._quiet_since = time.ticks_ms()
+        self._step = self._nearest_step(sensor.get_update_rate())
+        # количество переключений частоты
+        self.switch_count = 0
+
+    def _nearest_step(self, rate: int) -> int:
+        """Возвращает индекс ступени частоты, ближайшей к rate"""
+        steps = self._steps
+        for index, r in enumerate(steps):
+            if r >= rate:
+                return index
+        return len(steps) - 1
+
+    @property
+    def rate_of_change(self) -> int:
+        """Сглаженная скорость изменения магнитного поля, 'сырые' единицы в секунду"""
+        return self._rate_of_change
+
+    def get_update_rate(self) -> int:
+        """Текущая частота обновления данных, Гц"""
+        return self._steps[self._step]
+
+    def _apply(self, step: int):
+        """Устанавливает частоту обновления данных датчиком и перезапускает периодические измерения"""
+        sen = self._sensor
+        self._step = step
+        sen.set_update_rate(self._steps[step])
+        sen.start_measure(continuous_mode=True, auto_set_reset=sen.is_auto_set_reset)
+        self._quiet_since = time.ticks_ms()
+        self.switch_count += 1
+
+    def update(self, sample: tuple) -> bool:
+        """Передает регулятору очередной результат измерения (X, Y, Z).
+        Возвращает Истина, если частота обновления данных датчика была изменена."""
+        prev = self._prev
+        if not self._has_prev:
+            for axis in range(3):
+                prev[axis] = sample[axis]
+            self._has_prev = True
+            return False
+        delta = 0
+        for axis in range(3):
+            delta += abs(sample[axis] - prev[axis])
+            prev[axis] = sample[axis]
+        roc = self._rate_of_change
+        roc += (delta * self.get_update_rate() - roc) >> self._shift
+        self._rate_of_change = roc
+        last = len(self._steps) - 1
+        if roc > self._rise:
+            self._quiet_since = time.ticks_ms()
+            if self._step < last:
+                self._apply(last)
+                return True
+            return False
+        if roc >= self._fall:
+            self._quiet_since = time.ticks_ms()
+            return False
+        if self._step > 0 and time.ticks_diff(time.ticks_ms(), self._quiet_since) >= self._hold_ms:
+            self._apply(self._step - 1)
+            return True
+        return False
+
+
+class RecoveringReader(Iterator):
+    """Чтение результатов измерений в режиме периодических измерений с восстановлением после сбоев.
+    Ошибка обмена (OSError) не прерывает цикл сбора данных: итерация возвращает None, а датчик проверяется
+    (get_id) и его настройки записываются повторно (restore_config). Сброс датчика (потеря настроек)
+    определяется по отсутствию новых данных в течение stall_periods периодов обновления.
+    Кратковременные ошибки шины лучше повторять адаптером sensor_pack.bus_service.RetryAdapter!"""
+
+    def __init__(self, sensor: MMC5603, stall_periods: int = 5, retry_interval_ms: int = 100):
+        """sensor - датчик, для которого уже вызван start_measure.
+        stall_periods - количество периодов обновления без новых данных, после которого настройки восстанавливаются.
+        retry_interval_ms - наименьший интервал между попытками восстановления."""
+        check_value(stall_periods, range(2, 256), f"Invalid stall_periods value: {stall_periods}")
+        self._sensor = sensor
+        self._stall_periods = stall_periods
+        self._retry_interval_ms = retry_interval_ms
+        self._last_sample = time.ticks_ms()
+        self._last_attempt = time.ticks_add(time.ticks_ms(), -retry_interval_ms)
+        # счетчики
+        self.bus_error_count = 0        # ошибки обмена при чтении результатов
+        self.stall_count = 0            # обнаружено отсутствие новых данных
+        self.recovery_count = 0         # успешные восстановления настроек
+        self.failed_recovery_count = 0  # неудачные попытки восстановления
+
+    def _stall_timeout_ms(self) -> int:
+        return self._stall_periods * (1 + 1000 // self._sensor.get_update_rate())
+
+    def _recover(self):
+        """Проверка датчика и восстановление его настроек"""
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self._last_attempt) < self._retry_interval_ms:
+            return
+        self._last_attempt = now
+        sen = self._sensor
+        try:
+            if 0x10 != sen.get_id():
+                self.failed_recovery_count += 1
+                return
+            sen.restore_config()
+        except OSError:
+            self.failed_recovery_count += 1
+            return
+        self.recovery_count += 1
+        self._last_sample = time.ticks_ms()
+
+    def __next__(self):
+        sen = self._sensor
+        try:
+            result = next(sen)
+        except OSError:
+            self.bus_error_count += 1
+            self._recover()
+            return None
+        now = time.ticks_ms()
+        if result is not None:
+            self._last_sample = now
+            return result
+        if sen.is_continuous_meas_mode() and time.ticks_diff(now, self._last_sample) > self._stall_timeout_ms():
+            self.stall_count += 1
+            self._last_sample = now
+            self._recover()
         return None
@@ -1,12 +1,11 @@
 # micropython
 # MIT license
 # Copyright (c) 2022 Roman Shevchik   goctaprog@gmail.com
-import struct
-
-import micropython
-import ustruct
+try:
+    import micropython
+except ImportError:     # CPython
+    from sensor_pack.mpy_compat import micropython
 from sensor_pack import bus_service
-from machine import SPI
 
 
 @micropython.native
@@ -19,7 +18,7 @@ def check_value(value: int, valid_range, error_msg: str) -> int:
 class Device:
     """Base device class"""
 
-    def __init__(self, adapter: bus_service.BusAdapter, address: [int, SPI], big_byte_order: bool):
+    def __init__(self, adapter: bus_service.BusAdapter, address: [int, "SPI"], big_byte_order: bool):
         """Базовый класс Устройство.
         Если big_byte_order равен True -> порядок байтов в регистрах устройства «big»
         (Порядок от старшего к младшему), в противном случае порядок байтов в регистрах "little"
@@ -54,7 +53,12 @@ class Device:
         bo = self._get_byteorder_as_str()[1]
         if redefine_byte_order is not None:
             bo = redefine_byte_order[0]
-        return ustruct.unpack(bo + fmt_char, source)
+        # ленивый импорт. Модуль загружается при первом вызове
+        try:
+            import ustruct as struct
+        except ImportError:     # CPython
+            import struct
+        return struct.unpack(bo + fmt_char, source)
 
     @micropython.native
     def is_big_byteorder(self) -> bool:
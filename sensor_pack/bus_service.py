@@ -3,8 +3,10 @@
 # Copyright (c) 2022 Roman Shevchik   goctaprog@gmail.com
 """MicroPython модуль для работы с шинами ввода/вывода"""
 
-import math
-from machine import I2C, SPI, Pin
+import time
+# модуль machine не импортируется: типы шин (I2C, SPI, Pin) указаны в аннотациях строками!
+if not hasattr(time, "ticks_ms"):   # CPython
+    from sensor_pack.mpy_compat import time
 
 
 def _mpy_bl(value: int) -> int:
@@ -12,39 +14,40 @@ def _mpy_bl(value: int) -> int:
     Аналог int.bit_length(), которая есть в Python, но отсутствует в MicroPython!"""
     if 0 == value:
         return 0
+    import math     # ленивый импорт. нужен только здесь
     return 1 + int(math.log2(abs(value)))
 
 
 class BusAdapter:
     """Посредник между шиной ввода/вывода и классом ввода/вывода устройства"""
-    def __init__(self, bus: [I2C, SPI]):
+    def __init__(self, bus: ["I2C", "SPI"]):
         self.bus = bus
 
     def get_bus_type(self) -> type:
         """Возвращает тип шины"""
         return type(self.bus)
 
-    def read_register(self, device_addr: [int, Pin], reg_addr: int, bytes_count: int) -> bytes:
+    def read_register(self, device_addr: [int, "Pin"], reg_addr: int, bytes_count: int) -> bytes:
         """считывает из регистра датчика значение.
         device_addr - адрес датчика на шине. Для шины SPI это физический вывод MCU!
         reg_addr - адрес регистра в адресном пространстве датчика.
         bytes_count - размер значения в байтах."""
         raise NotImplementedError
 
-    def write_register(self, device_addr: [int, Pin], reg_addr: int, value: [int, bytes, bytearray],
+    def write_register(self, device_addr: [int, "Pin"], reg_addr: int, value: [int, bytes, bytearray],
                        bytes_count: int, byte_order: str):
         """записывает данные value в датчик, по адресу reg_addr.
         bytes_count - кол-во записываемых байт из value.
         byte_order - порядок расположения байт в записываемом значении."""
         raise NotImplementedError
 
-    def read(self, device_addr: [int, Pin], n_bytes: int) -> bytes:
+    def read(self, device_addr: [int, "Pin"], n_bytes: int) -> bytes:
         raise NotImplementedError
 
-    def write(self, device_addr: [int, Pin], buf: bytes):
+    def write(self, device_addr: [int, "Pin"], buf: bytes):
         raise NotImplementedError
 
-    def write_const(self, device_addr: [int, Pin], val: int, count: int):
+    def write_const(self, device_addr: [int, "Pin"], val: int, count: int):
         """Отправляет пакет байт со значение val количеством count на шину.
         Часто, при работе с дисплеями или памятью, требуется заполнение экрана/области
         постоянным значением. Для этого и предназначен этот метод!
@@ -72,7 +75,7 @@ class BusAdapter:
 
 class I2cAdapter(BusAdapter):
     """"""
-    def __init__(self, bus: I2C):
+    def __init__(self, bus: "I2C"):
         super().__init__(bus)
 
     def write_register(self, device_addr: int, reg_addr: int, value: [int, bytes, bytearray],
@@ -110,10 +113,66 @@ class I2cAdapter(BusAdapter):
         return self.bus.writeto_mem(device_addr, mem_addr, buf)
 
 
+class RetryAdapter(BusAdapter):
+    """Обертка над адаптером шины. Повторяет операцию обмена, завершившуюся OSError (например, после
+    кратковременной помехи на шине), пока не истечет время budget_ms. Затем исключение передается вызывающему.
+    Пример: MMC5603(RetryAdapter(I2cAdapter(i2c), budget_ms=20))"""
+    def __init__(self, adapter: BusAdapter, budget_ms: int = 20, retry_delay_us: int = 500):
+        super().__init__(adapter.bus)
+        self.adapter = adapter
+        self._budget_ms = budget_ms
+        self._delay_us = retry_delay_us
+        # счетчики
+        self.error_count = 0        # все ошибки обмена
+        self.recovered_count = 0    # операции, успешно выполненные после повтора
+        self.failure_count = 0      # операции, не выполненные за budget_ms
+
+    def _call(self, func, *args):
+        """Вызывает func(*args), повторяя вызов при OSError в пределах budget_ms"""
+        start = time.ticks_ms()
+        failed = False
+        while True:
+            try:
+                result = func(*args)
+            except OSError:
+                self.error_count += 1
+                if time.ticks_diff(time.ticks_ms(), start) >= self._budget_ms:
+                    self.failure_count += 1
+                    raise
+                failed = True
+                time.sleep_us(self._delay_us)
+                continue
+            if failed:
+                self.recovered_count += 1
+            return result
+
+    def get_bus_type(self) -> type:
+        return self.adapter.get_bus_type()
+
+    def read_register(self, device_addr: [int, "Pin"], reg_addr: int, bytes_count: int) -> bytes:
+        return self._call(self.adapter.read_register, device_addr, reg_addr, bytes_count)
+
+    def write_register(self, device_addr: [int, "Pin"], reg_addr: int, value: [int, bytes, bytearray],
+                       bytes_count: int, byte_order: str):
+        return self._call(self.adapter.write_register, device_addr, reg_addr, value, bytes_count, byte_order)
+
+    def read(self, device_addr: [int, "Pin"], n_bytes: int) -> bytes:
+        return self._call(self.adapter.read, device_addr, n_bytes)
+
+    def write(self, device_addr: [int, "Pin"], buf: bytes):
+        return self._call(self.adapter.write, device_addr, buf)
+
+    def read_buf_from_mem(self, device_addr: int, mem_addr, buf):
+        return self._call(self.adapter.read_buf_from_mem, device_addr, mem_addr, buf)
+
+    def write_buf_to_mem(self, device_addr: int, mem_addr, buf):
+        return self._call(self.adapter.write_buf_to_mem, device_addr, mem_addr, buf)
+
+
 class SpiAdapter(BusAdapter):
     """Параметр data_mode представляет собой вывод MCU, который используется для установки флага, что посылка является
     данными (high) или командой (low). Например это необходимо при обмене ILI9481."""
-    def __init__(self, bus: SPI, data_mode: Pin = None):
+    def __init__(self, bus: "SPI", data_mode: "Pin" = None):
         super().__init__(bus)
         # вывод MCU для режима данных
         self.data_mode_pin = data_mode
@@ -123,14 +182,14 @@ class SpiAdapter(BusAdapter):
         # flag for write.. methods. If True, then data_mode (Pin) will be set to True, otherwise to False!
         self.data_packet = False
 
-    def read_register(self, device_addr: Pin, reg_addr: int, bytes_count: int) -> bytes:
+    def read_register(self, device_addr: "Pin", reg_addr: int, bytes_count: int) -> bytes:
         raise NotImplementedError
 
-    def write_register(self, device_addr: Pin, reg_addr: int, value: [int, bytes, bytearray],
+    def write_register(self, device_addr: "Pin", reg_addr: int, value: [int, bytes, bytearray],
                        bytes_count: int, byte_order: str):
         raise NotImplementedError
 
-    def read(self, device_addr: Pin, n_bytes: int) -> bytes:
+    def read(self, device_addr: "Pin", n_bytes: int) -> bytes:
         """Read a number of bytes specified by n_bytes while continuously writing the single byte given by write.
         Returns a bytes object with the data that was read."""
         try:
@@ -139,7 +198,7 @@ class SpiAdapter(BusAdapter):
         finally:
             device_addr.high()
 
-    def readinto(self, device_addr: Pin, buf):
+    def readinto(self, device_addr: "Pin", buf):
         """Read into the buffer specified by buf while continuously writing the single byte given by write.
         Returns None."""
         try:
@@ -148,7 +207,7 @@ class SpiAdapter(BusAdapter):
         finally:
             device_addr.high()
 
-    def write(self, device_addr: Pin, buf: bytes):
+    def write(self, device_addr: "Pin", buf: bytes):
         """Параметр data_packet представляет собой признак того, что посылка является данными (high) или командой (low).
         Например это необходимо при обмене ILI9481.
         Write the bytes contained in buf. Returns None.
@@ -162,7 +221,7 @@ class SpiAdapter(BusAdapter):
         finally:
             device_addr.high()
 
-    def write_and_read(self, device_addr: Pin, wr_buf: bytes, rd_buf: bytes):
+    def write_and_read(self, device_addr: "Pin", wr_buf: bytes, rd_buf: bytes):
         """Параметр data_packet представляет собой признак того, что посылка является данными (high) или командой (low).
         Например это необходимо при обмене ILI9481.
         Write the bytes from write_buf while reading into read_buf. The buffers can be the same or different,
@@ -0,0 +1,205 @@
+# micropython
+# MIT license
+# Copyright (c) 2022 Roman Shevchik   goctaprog@gmail.com
+"""Запись обмена драйвера датчика с шиной в компактный двоичный файл (трассу) и воспроизведение трассы.
+Позволяет повторять работу драйвера на реальных данных без датчика, например под CPython,
+для воспроизводимой оценки производительности декодирования, фильтрации и планирования измерений.
+
+Формат трассы: сигнатура b'BTR1', затем записи. Запись: заголовок '<BBBHI' (операция, адрес устройства,
+адрес регистра, длина данных, время от предыдущей записи в мкс) и данные (прочитанные или записанные байты).
+Если операция завершилась ошибкой (OSError), то к коду операции добавляется флаг OP_ERROR,
+а данные записи - код ошибки (errno, два байта, little endian). При воспроизведении ошибка возбуждается снова."""
+
+import time
+from sensor_pack.bus_service import BusAdapter
+if not hasattr(time, "ticks_us"):   # CPython
+    from sensor_pack.mpy_compat import time
+try:
+    import ustruct as struct
+except ImportError:     # CPython
+    import struct
+
+_MAGIC = b'BTR1'
+_HDR_FMT = '<BBBHI'
+_HDR_SIZE = struct.calcsize(_HDR_FMT)
+
+# операции
+OP_READ_REGISTER = 1
+OP_READ_BUF_FROM_MEM = 2
+OP_WRITE_REGISTER = 3
+OP_WRITE_BUF_TO_MEM = 4
+OP_READ = 5
+OP_WRITE = 6
+OP_ERROR = 0x80     # флаг: операция завершилась ошибкой
+
+
+def _byte_view(buf) -> memoryview:
+    """memoryview буфера buf (bytes, bytearray, array любого типа), элементы которого - байты"""
+    mv = memoryview(buf)
+    return mv.cast('B') if hasattr(mv, 'cast') else mv     # в MicroPython нет memoryview.cast
+
+
+class RecordingAdapter(BusAdapter):
+    """Обертка над адаптером шины, записывающая в поток stream (например, файл, открытый в режиме 'wb')
+    каждый вызов с данными и временем. Пример: MMC5603(RecordingAdapter(I2cAdapter(i2c), open('trace.bin', 'wb')))"""
+
+    def __init__(self, adapter: BusAdapter, stream):
+        super().__init__(adapter.bus)
+        self.adapter = adapter
+        self._stream = stream
+        self._hdr = bytearray(_HDR_SIZE)
+        self._prev = time.ticks_us()
+        self.record_count = 0
+        stream.write(_MAGIC)
+
+    def _record(self, op: int, device_addr: int, reg_addr: int, data):
+        data = _byte_view(data)     # длина - в байтах, а не в элементах, например, для array('H')
+        now = time.ticks_us()
+        dt = min(0xFFFF_FFFF, max(0, time.ticks_diff(now, self._prev)))
+        self._prev = now
+        struct.pack_into(_HDR_FMT, self._hdr, 0, op, device_addr, reg_addr, len(data), dt)
+        self._stream.write(self._hdr)
+        self._stream.write(data)
+        self.record_count += 1
+
+    def _call(self, op: int, device_addr: int, reg_addr: int, func, *args):
+        """Вызывает func(*args). При OSError записывает в трассу запись ошибки и возбуждает исключение снова"""
+        try:
+            return func(*args)
+        except OSError as e:
+            code = e.args[0] if e.args and isinstance(e.args[0], int) else 0
+            self._record(op | OP_ERROR, device_addr, reg_addr, (code & 0xFFFF).to_bytes(2, 'little'))
+            raise
+
+    def close(self):
+        """Закрывает поток записи трассы"""
+        self._stream.close()
+
+    def get_bus_type(self) -> type:
+        return self.adapter.get_bus_type()
+
+    def read_register(self, device_addr: int, reg_addr: int, bytes_count: int) -> bytes:
+        result = self._call(OP_READ_REGISTER, device_addr, reg_addr,
+                            self.adapter.read_register, device_addr, reg_addr, bytes_count)
+        self._record(OP_READ_REGISTER, device_addr, reg_addr, result)
+        return result
+
+    def read_buf_from_mem(self, device_addr: int, mem_addr, buf):
+        result = self._call(OP_READ_BUF_FROM_MEM, device_addr, mem_addr,
+                            self.adapter.read_buf_from_mem, device_addr, mem_addr, buf)
+        self._record(OP_READ_BUF_FROM_MEM, device_addr, mem_addr, buf)
+        return result
+
+    def write_register(self, device_addr: int, reg_addr: int, value: [int, bytes, bytearray],
+                       bytes_count: int, byte_order: str):
+        result = self._call(OP_WRITE_REGISTER, device_addr, reg_addr,
+                            self.adapter.write_register, device_addr, reg_addr, value, bytes_count, byte_order)
+        data = value.to_bytes(bytes_count, byte_order) if isinstance(value, int) else value
+        self._record(OP_WRITE_REGISTER, device_addr, reg_addr, data)
+        return result
+
+    def write_buf_to_mem(self, device_addr: int, mem_addr, buf):
+        result = self._call(OP_WRITE_BUF_TO_MEM, device_addr, mem_addr,
+                            self.adapter.write_buf_to_mem, device_addr, mem_addr, buf)
+        self._record(OP_WRITE_BUF_TO_MEM, device_addr, mem_addr, buf)
+        return result
+
+    def read(self, device_addr: int, n_bytes: int) -> bytes:
+        result = self._call(OP_READ, device_addr, 0, self.adapter.read, device_addr, n_bytes)
+        self._record(OP_READ, device_addr, 0, result)
+        return result
+
+    def write(self, device_addr: int, buf: bytes):
+        result = self._call(OP_WRITE, device_addr, 0, self.adapter.write, device_addr, buf)
+        self._record(OP_WRITE, device_addr, 0, buf)
+        return result
+
+
+class ReplayAdapter(BusAdapter):
+    """Воспроизводит трассу, записанную RecordingAdapter. Операции чтения возвращают записанные данные,
+    операции записи только проверяются, записанные ошибки шины возбуждаются снова (OSError). Если strict is True, то каждый
+    вызов сверяется с трассой (операция, адрес устройства, адрес регистра, длина, а для операций записи - и записываемые
+    байты), при расхождении возбуждается ValueError.
+    Если strict is False, то в буфер копируется не более len(buf) байт.
+    Если real_time is True, то паузы между вызовами соответствуют записанным, иначе трасса
+    воспроизводится с наибольшей скоростью. По окончании трассы возбуждается EOFError."""
+
+    def __init__(self, trace: [bytes, bytearray], real_time: bool = False, strict: bool = True):
+        if trace[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("Invalid trace signature!")
+        super().__init__(None)
+        self._trace = memoryview(trace)
+        self._real_time = real_time
+        self._strict = strict
+        self.rewind()
+
+    @staticmethod
+    def from_file(path: str, real_time: bool = False, strict: bool = True):
+        """Загружает трассу из файла"""
+        with open(path, 'rb') as f:
+            return ReplayAdapter(f.read(), real_time, strict)
+
+    def rewind(self):
+        """Воспроизведение трассы с начала"""
+        self._offs = len(_MAGIC)
+        self._deadline = time.ticks_us()
+        self.record_count = 0
+
+    @property
+    def at_end(self) -> bool:
+        """Истина, когда трасса воспроизведена полностью"""
+        return self._offs >= len(self._trace)
+
+    def _next(self, op: int, device_addr: int, reg_addr: int, length: int, payload=None) -> memoryview:
+        """Возвращает данные очередной записи трассы. payload - записываемые байты (для операций записи)"""
+        if self.at_end:
+            raise EOFError("End of bus trace")
+        offs = self._offs
+        _op, _dev, _reg, _len, dt = struct.unpack_from(_HDR_FMT, self._trace, offs)
+        offs += _HDR_SIZE
+        error = _op & OP_ERROR
+        _op &= ~OP_ERROR
+        # длина записи ошибки - длина кода ошибки, поэтому не сравнивается
+        _cmp_len = length if error else _len
+        if self._strict and (op, device_addr, reg_addr, length) != (_op, _dev, _reg, _cmp_len):
+            raise ValueError(f"Bus trace mismatch at record {self.record_count}: "
+                             f"expected {(_op, _dev, _reg, _len)}, got {(op, device_addr, reg_addr, length)}")
+        data = self._trace[offs:offs + _len]
+        if self._strict and not error and payload is not None and bytes(data) != bytes(payload):
+            raise ValueError(f"Bus trace mismatch at record {self.record_count}: "
+                             f"expected data {bytes(data)}, got {bytes(payload)}")
+        self._offs = offs + _len
+        self.record_count += 1
+        if self._real_time:
+            self._deadline = time.ticks_add(self._deadline, dt)
+            wait = time.ticks_diff(self._deadline, time.ticks_us())
+            if wait > 0:
+                time.sleep_us(wait)
+        if error:
+            raise OSError(int.from_bytes(data, 'little'))
+        return data
+
+    def read_register(self, device_addr: int, reg_addr: int, bytes_count: int) -> bytes:
+        return bytes(self._next(OP_READ_REGISTER, device_addr, reg_addr, bytes_count))
+
+    def read_buf_from_mem(self, device_addr: int, mem_addr, buf):
+        view = _byte_view(buf)
+        data = self._next(OP_READ_BUF_FROM_MEM, device_addr, mem_addr, len(view))
+        count = min(len(view), len(data))
+        view[:count] = data[:count]
+
+    def write_register(self, device_addr: int, reg_addr: int, value: [int, bytes, bytearray],
+                       bytes_count: int, byte_order: str):
+        data = _byte_view(value.to_bytes(bytes_count, byte_order) if isinstance(value, int) else value)
+        self._next(OP_WRITE_REGISTER, device_addr, reg_addr, len(data), data)
+
+    def write_buf_to_mem(self, device_addr: int, mem_addr, buf):
+        data = _byte_view(buf)
+        self._next(OP_WRITE_BUF_TO_MEM, device_addr, mem_addr, len(data), data)
+
+    def read(self, device_addr: int, n_bytes: int) -> bytes:
+        return bytes(self._next(OP_READ, device_addr, 0, n_bytes))
+
+    def write(self, device_addr: int, buf: bytes):
+        data = _byte_view(buf)
+        self._next(OP_WRITE, device_addr, 0, len(data), data)
@@ -0,0 +1,187 @@
+# CPython, Linux
+# MIT license
+# Copyright (c) 2022 Roman Shevchik   goctaprog@gmail.com
+"""Адаптер шины I2C для CPython на Linux (интерфейс i2c-dev, /dev/i2c-N).
+Чтение регистра выполняется одной транзакцией I2C_RDWR (запись адреса регистра + чтение, с повторным
+стартом). Внутренние буферы адаптера и указатели на них выделяются один раз; на буферы вызывающего
+адаптер не ссылается после завершения транзакции. Проверка без устройства: модуль ядра i2c-stub
+(modprobe i2c-stub chip_addr=0x30) или функция ioctl_func, имитирующая ядро."""
+
+import ctypes
+import os
+from sensor_pack.bus_service import BusAdapter
+
+I2C_RDWR = 0x0707   # ioctl: комбинированная транзакция из нескольких сообщений
+I2C_M_RD = 0x0001   # флаг сообщения: чтение
+I2C_RDWR_IOCTL_MAX_MSGS = 42    # ограничение ядра на количество сообщений в одной транзакции
+
+
+class I2cMsg(ctypes.Structure):
+    """struct i2c_msg из linux/i2c.h"""
+    _fields_ = [("addr", ctypes.c_uint16),
+                ("flags", ctypes.c_uint16),
+                ("len", ctypes.c_uint16),
+                ("buf", ctypes.POINTER(ctypes.c_uint8))]
+
+
+class I2cRdwrIoctlData(ctypes.Structure):
+    """struct i2c_rdwr_ioctl_data из linux/i2c-dev.h"""
+    _fields_ = [("msgs", ctypes.POINTER(I2cMsg)),
+                ("nmsgs", ctypes.c_uint32)]
+
+
+class LinuxI2cAdapter(BusAdapter):
+    """Адаптер шины I2C Linux. Методы совместимы с I2cAdapter, поэтому драйверы датчиков работают без изменений"""
+
+    def __init__(self, bus: [int, str] = 1, max_msgs: int = 8, ioctl_func=None):
+        """bus - номер шины (N в /dev/i2c-N) или путь к файлу устройства.
+        max_msgs - наибольшее количество сообщений в одной транзакции (метод transfer), не менее 2.
+        ioctl_func(fd, request, arg) - замена fcntl.ioctl, например для проверки без устройства.
+        Если ioctl_func задана, файл устройства не открывается!"""
+        if not 2 <= max_msgs <= I2C_RDWR_IOCTL_MAX_MSGS:
+            raise ValueError(f"Invalid max_msgs value: {max_msgs}")
+        if ioctl_func is None:
+            import fcntl
+            ioctl_func = fcntl.ioctl
+            path = bus if isinstance(bus, str) else f"/dev/i2c-{bus}"
+            fd = os.open(path, os.O_RDWR)
+        else:
+            fd = -1
+        super().__init__(fd)
+        self._ioctl = ioctl_func
+        self._max_msgs = max_msgs
+        self._msgs = (I2cMsg * max_msgs)()
+        self._data = I2cRdwrIoctlData(ctypes.cast(self._msgs, ctypes.POINTER(I2cMsg)), 0)
+        # адреса регистров, по одному байту на сообщение
+        self._reg_addr = bytearray(max_msgs)
+        self._reg_ptr = tuple(self._pointer(self._reg_addr, i) for i in range(max_msgs))
+        self._null_ptr = ctypes.POINTER(ctypes.c_uint8)()   # пустой указатель
+        # буферы (и указатели на них), используемые повторно: для чтения в read_register и для записи
+        # в write_register. Ключ - размер буфера
+        self._rd_bufs = {}
+        self._wr_bufs = {}
+
+    @staticmethod
+    def _pointer(buf, offset: int = 0):
+        """Указатель на байт offset буфера buf (bytearray, array, memoryview...) без копирования данных.
+        ctypes.cast не используется: он создает циклические ссылки, и буфер освобождается только сборщиком мусора"""
+        return ctypes.pointer(ctypes.c_uint8.from_buffer(buf, offset))
+
+    def _buf_pointer(self, buf, read: bool):
+        """Возвращает размер буфера buf в байтах и указатель на его данные, действительный на время одной транзакции.
+        Указатель не сохраняется: пока он существует, размер буфера (например, bytearray) изменить нельзя!
+        Для чтения буфер должен быть изменяемым (bytearray, array, memoryview...), иначе возбуждается TypeError.
+        Для записи данные неизменяемого буфера (bytes) копируются!"""
+        mv = memoryview(buf)
+        size = mv.nbytes
+        if mv.readonly and read:
+            raise TypeError("Buffer for reading must be writable!")
+        if 0 == size:
+            return size, self._null_ptr
+        if mv.readonly:
+            return size, self._pointer(bytearray(buf))   # указатель хранит ссылку на копию
+        return size, self._pointer(buf)
+
+    def _get_buf(self, cache: dict, size: int) -> tuple:
+        """Возвращает внутренний буфер адаптера размером size байт и указатель на него"""
+        item = cache.get(size)
+        if item is None:
+            buf = bytearray(size)
+            item = buf, self._pointer(buf) if size else self._null_ptr
+            cache[size] = item
+        return item
+
+    def close(self):
+        """Закрывает файл устройства"""
+        if self.bus >= 0:
+            os.close(self.bus)
+            self.bus = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _set_msg(self, index: int, device_addr: int, read: bool, length: int, ptr):
+        msg = self._msgs[index]
+        msg.addr = device_addr
+        msg.flags = I2C_M_RD if read else 0
+        msg.len = length
+        msg.buf = ptr
+
+    def _rdwr(self, count: int):
+        """Выполняет транзакцию из count первых сообщений. Затем сообщения перестают ссылаться на буферы"""
+        self._data.nmsgs = count
+        try:
+            self._ioctl(self.bus, I2C_RDWR, self._data)
+        finally:
+            # присваивание None не освобождает ссылку ctypes на буфер, поэтому присваивается пустой указатель
+            null = self._null_ptr
+            for index in range(count):
+                self._msgs[index].buf = null
+
+    def transfer(self, messages):
+        """Выполняет последовательность сообщений одной транзакцией I2C_RDWR (с повторным стартом между ними).
+        messages - последовательность кортежей (device_addr, read, buf). Если read is True, то данные читаются
+        в buf (изменяемый буфер), иначе записываются из buf."""
+        count = len(messages)
+        if count > self._max_msgs:
+            raise ValueError(f"Too many messages: {count}")
+        for index, (device_addr, read, buf) in enumerate(messages):
+            size, ptr = self._buf_pointer(buf, read)
+            self._set_msg(index, device_addr, read, size, ptr)
+        self._rdwr(count)
+
+    def read_buf_from_mem(self, device_addr: int, mem_addr, buf):
+        """Читает из устройства с адресом device_addr в буфер buf, начиная с адреса в устройстве mem_addr.
+        Количество считываемых байт определяется длинной буфера buf. Одна транзакция I2C_RDWR."""
+        size, ptr = self._buf_pointer(buf, True)
+        self._read_mem(device_addr, mem_addr, size, ptr)
+
+    def _read_mem(self, device_addr: int, mem_addr: int, size: int, ptr):
+        """Записывает адрес mem_addr и читает size байт по указателю ptr одной транзакцией"""
+        self._reg_addr[0] = mem_addr
+        self._set_msg(0, device_addr, False, 1, self._reg_ptr[0])
+        self._set_msg(1, device_addr, True, size, ptr)
+        self._rdwr(2)
+
+    def read_register(self, device_addr: int, reg_addr: int, bytes_count: int) -> bytes:
+        """считывает из регистра датчика значение.
+        bytes_count - размер значения в байтах"""
+        buf, ptr = self._get_buf(self._rd_bufs, bytes_count)
+        self._read_mem(device_addr, reg_addr, bytes_count, ptr)
+        return bytes(buf)
+
+    def _write_to_mem(self, device_addr: int, mem_addr: int, data):
+        """Записывает адрес mem_addr и данные data (любой буфер) одним сообщением"""
+        size = 1 + memoryview(data).nbytes
+        buf, ptr = self._get_buf(self._wr_bufs, size)
+        buf[0] = mem_addr
+        buf[1:] = data      # копируются байты буфера, размер buf не изменяется
+        self._set_msg(0, device_addr, False, size, ptr)
+        self._rdwr(1)
+
+    def write_register(self, device_addr: int, reg_addr: int, value: [int, bytes, bytearray],
+                       bytes_count: int, byte_order: str):
+        """записывает данные value в датчик, по адресу reg_addr.
+        bytes_count - кол-во записываемых данных
+        value - должно быть типов int, bytes, bytearray"""
+        buf = value
+        if isinstance(value, int):
+            buf = value.to_bytes(bytes_count, byte_order)
+        self._write_to_mem(device_addr, reg_addr, buf)
+
+    def write_buf_to_mem(self, device_addr: int, mem_addr, buf):
+        """Записывает в устройство с адресом device_addr все байты из буфера buf.
+        Запись начинается с адреса в устройстве: mem_addr."""
+        self._write_to_mem(device_addr, mem_addr, buf)
+
+    def read(self, device_addr: int, n_bytes: int) -> bytes:
+        buf, ptr = self._get_buf(self._rd_bufs, n_bytes)
+        self._set_msg(0, device_addr, True, n_bytes, ptr)
+        self._rdwr(1)
+        return bytes(buf)
+
+    def write(self, device_addr: int, buf: bytes):
+        self.transfer(((device_addr, False, buf),))
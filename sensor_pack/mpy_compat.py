@@ -0,0 +1,51 @@
+# micropython
+# MIT license
+# Copyright (c) 2022 Roman Shevchik   goctaprog@gmail.com
+"""Замена встроенных модулей MicroPython при работе под CPython (например, на шлюзе с Linux).
+Под MicroPython этот модуль не используется!"""
+
+import time as _time
+
+
+class micropython:
+    """Декораторы эмиттеров кода MicroPython под CPython ничего не делают"""
+    @staticmethod
+    def native(func):
+        return func
+
+    @staticmethod
+    def viper(func):
+        return func
+
+    @staticmethod
+    def const(value):
+        return value
+
+
+class time:
+    """Функции модуля time MicroPython, отсутствующие в CPython"""
+    sleep = staticmethod(_time.sleep)
+
+    @staticmethod
+    def sleep_ms(value: int):
+        _time.sleep(0.001 * value)
+
+    @staticmethod
+    def sleep_us(value: int):
+        _time.sleep(0.000_001 * value)
+
+    @staticmethod
+    def ticks_ms() -> int:
+        return _time.monotonic_ns() // 1_000_000
+
+    @staticmethod
+    def ticks_us() -> int:
+        return _time.monotonic_ns() // 1_000
+
+    @staticmethod
+    def ticks_add(ticks: int, delta: int) -> int:
+        return ticks + delta
+
+    @staticmethod
+    def ticks_diff(ticks_1: int, ticks_2: int) -> int:
+        return ticks_1 - ticks_2
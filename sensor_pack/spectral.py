@@ -0,0 +1,238 @@
+# micropython
+# MIT license
+# Copyright (c) 2022 Roman Shevchik   goctaprog@gmail.com
+"""Спектральный анализ потока отсчетов блоками (окнами) фиксированного размера.
+Используется ulab (MicroPython) или NumPy (CPython), если они доступны, иначе алгоритм Гёрцеля
+в целочисленной арифметике (fixed point)."""
+
+import array
+import math
+try:
+    import micropython
+except ImportError:     # CPython
+    from sensor_pack.mpy_compat import micropython
+
+try:
+    from ulab import numpy as np
+except ImportError:
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+_Q = 14         # число дробных бит коэффициентов алгоритма Гёрцеля, |coeff| < 2 ** (_Q + 1)
+_Q_WIN = 14     # наибольшее число дробных бит коэффициентов окна Ханна
+# Наибольшее значение переменных состояния алгоритма Гёрцеля. Произведение coeff * s вычисляется по частям
+# (s = hi * 2 ** _Q + lo), каждая из которых меньше 2 ** 29, поэтому все значения остаются 'малыми' целыми
+# MicroPython (31 бит) и не размещаются в куче
+_S_MAX = 1 << 28
+_LO_MASK = (1 << _Q) - 1
+_HALF_Q = 1 << (_Q - 1)
+
+
+class SpectralAnalyzer:
+    """Собирает window_size отсчетов по channels каналам и для каждого заполненного окна вычисляет:
+    мощность на частотах frequencies и в полосах bands (кортежи (нижняя частота, верхняя частота), Гц),
+    частоту самого мощного из этих (запрошенных) бинов - strongest, и, только с ulab/NumPy,
+    доминирующую частоту по всему спектру - dominant. Если мощность равна нулю, то частота равна 0.
+    Из отсчетов вычитается среднее и применяется окно Ханна. Мощность - в относительных единицах
+    (квадрат модуля бина ДПФ).
+    Без ulab/NumPy алгоритм Гёрцеля выполняется для каждого отсчета, в методе feed, только для запрошенных
+    бинов, поэтому затраты CPU равномерно распределены по отсчетам: channels * количество бинов операций
+    на отсчет. В этом случае вычитается среднее предыдущего окна (для первого окна - первый отсчет).
+    Экземпляр можно передать в MMC5603.add_handler."""
+
+    def __init__(self, window_size: int, sample_rate: float, frequencies: tuple = (50, 60),
+                 bands: tuple = (), channels: int = 3, use_numpy: bool = True, max_amplitude: int = 1 << 14):
+        """window_size - размер окна, отсчетов. Для ulab должен быть степенью двойки!
+        sample_rate - частота отсчетов, Гц. Например MMC5603.get_update_rate().
+        max_amplitude - наибольшее ожидаемое отклонение отсчета от среднего, 'сырые' единицы. Используется
+        целочисленной реализацией для выбора масштаба: большие отклонения ограничиваются!"""
+        if window_size < 4:
+            raise ValueError(f"Invalid window size: {window_size}")
+        self._n = window_size
+        self._fs = sample_rate
+        self._ch = channels
+        self._np = np if use_numpy else None
+        self._count = 0
+        half = window_size // 2
+        # номера бинов ДПФ для частот и полос
+        self._freq_bins = tuple(self._to_bin(f) for f in frequencies)
+        self._band_bins = tuple((self._to_bin(lo), self._to_bin(hi)) for lo, hi in bands)
+        for k in self._freq_bins + tuple(k for band in self._band_bins for k in band):
+            if not 0 < k < half:
+                raise ValueError(f"Frequency out of range (0, {sample_rate / 2}): {k * sample_rate / window_size}")
+        # все запрошенные бины
+        bins = set(self._freq_bins)
+        for lo, hi in self._band_bins:
+            bins.update(range(lo, 1 + hi))
+        self._bins = tuple(sorted(bins))
+        nb = len(self._bins)
+        self._bin_power = array.array('f', bytes(4 * channels * nb))
+        # окно Ханна
+        hann = [0.5 - 0.5 * math.cos(2 * math.pi * i / (window_size - 1)) for i in range(window_size)]
+        if self._np:
+            self._buf = array.array('i', bytes(4 * window_size * channels))
+            self._window = self._np.array(hann)
+            self._x = self._np.zeros(window_size)
+        else:
+            self._init_fixed(hann, channels, nb, max_amplitude)
+        # результаты
+        self.dominant = array.array('f', bytes(4 * channels))       # Гц, только с ulab/NumPy
+        self.strongest = array.array('f', bytes(4 * channels))      # Гц
+        self.freq_power = array.array('f', bytes(4 * channels * len(frequencies)))
+        self.band_power = array.array('f', bytes(4 * channels * len(bands)))
+        self.window_count = 0
+
+    def _init_fixed(self, hann, channels: int, nb: int, max_amplitude: int):
+        """Подготовка целочисленной реализации алгоритма Гёрцеля. Отсчеты используются с полным разрешением,
+        переменные состояния имеют self._frac дробных бит, все сдвиги вправо - с округлением."""
+        n = self._n
+        self._x_max = max(1, max_amplitude)
+        q_win = _Q_WIN
+        while q_win > 0 and self._x_max << q_win >= 1 << 29:    # x * w < 2 ** 29
+            q_win -= 1
+        self._window = array.array('i', (int(0.5 + w * (1 << q_win)) for w in hann))
+        self._coeffs = array.array('i', (round(2 * math.cos(2 * math.pi * k / n) * (1 << _Q)) for k in self._bins))
+        # |s| <= sum(|x * w|) / |sin(w)| + ошибка округления (не более 1 на шаг), поэтому число дробных бит
+        # выбирается так, чтобы |s| < _S_MAX
+        sin_min = min(abs(math.sin(2 * math.pi * k / n)) for k in self._bins)
+        bound = self._x_max * sum(hann) / sin_min
+        frac = q_win
+        while bound * 2.0 ** frac + n / sin_min >= _S_MAX:
+            frac -= 1
+        self._frac = frac
+        self._win_shift = q_win - frac     # сдвиг произведения x * w к масштабу переменных состояния
+        self._s1 = array.array('i', bytes(4 * channels * nb))
+        self._s2 = array.array('i', bytes(4 * channels * nb))
+        self._dc = array.array('i', bytes(4 * channels))     # среднее предыдущего окна
+        self._sum = [0 for _ in range(channels)]            # сумма отсчетов текущего окна
+        self._dc_valid = False
+
+    def _to_bin(self, freq: float) -> int:
+        """Номер ближайшего к частоте freq бина ДПФ"""
+        return int(0.5 + freq * self._n / self._fs)
+
+    @property
+    def resolution(self) -> float:
+        """Разрешение по частоте, Гц"""
+        return self._fs / self._n
+
+    @property
+    def full_spectrum(self) -> bool:
+        """Истина, если анализируется весь спектр (ulab/NumPy) и dominant доступна"""
+        return self._np is not None
+
+    def feed(self, sample) -> bool:
+        """Добавляет отсчет (по одному значению на канал). Возвращает Истина, если окно заполнено
+        и результаты его анализа обновлены."""
+        if self._np:
+            self._store(sample)
+        else:
+            self._goertzel_step(sample)
+        self._count += 1
+        if self._count < self._n:
+            return False
+        self._count = 0
+        for i in range(self._ch):
+            if self._np:
+                self._analyze_np(i)
+            else:
+                self._finish_fixed(i)
+            self._report(i)
+        self.window_count += 1
+        return True
+
+    def __call__(self, sample):
+        self.feed(sample)
+
+    @micropython.native
+    def _store(self, sample):
+        ch, buf = self._ch, self._buf
+        offs = ch * self._count
+        for i in range(ch):
+            buf[offs + i] = sample[i]
+
+    @micropython.native
+    def _goertzel_step(self, sample):
+        """Один шаг алгоритма Гёрцеля для каждого канала и запрошенного бина. Все значения - 'малые' целые"""
+        ch, nb = self._ch, len(self._bins)
+        dc, s1, s2, coeffs = self._dc, self._s1, self._s2, self._coeffs
+        if not self._dc_valid:
+            for i in range(ch):
+                dc[i] = sample[i]
+            self._dc_valid = True
+        w = self._window[self._count]
+        shift, x_max = self._win_shift, self._x_max
+        half = (1 << shift) >> 1
+        for i in range(ch):
+            raw = sample[i]
+            self._sum[i] += raw
+            x = raw - dc[i]
+            if x > x_max:
+                x = x_max
+            elif x < -x_max:
+                x = -x_max
+            xw = (x * w + half) >> shift
+            base = i * nb
+            for b in range(nb):
+                index = base + b
+                prev = s1[index]
+                c = coeffs[b]
+                # c * prev / 2 ** _Q с округлением, по частям
+                s1[index] = xw + c * (prev >> _Q) + ((c * (prev & _LO_MASK) + _HALF_Q) >> _Q) - s2[index]
+                s2[index] = prev
+
+    def _finish_fixed(self, channel: int):
+        """Мощность запрошенных бинов канала по окончании окна, сброс состояния алгоритма Гёрцеля"""
+        nb, n = len(self._bins), self._n
+        s1, s2, bp = self._s1, self._s2, self._bin_power
+        scale = 2.0 ** (-2 * self._frac)
+        for b in range(nb):
+            index = channel * nb + b
+            a, c = float(s1[index]), float(s2[index])
+            bp[index] = scale * (a * a + c * c - self._coeffs[b] * a * c / (1 << _Q))
+            s1[index] = s2[index] = 0
+        self._dc[channel] = self._sum[channel] // n
+        self._sum[channel] = 0
+
+    def _analyze_np(self, channel: int):
+        """Спектр канала с помощью ulab/NumPy: dominant и мощность запрошенных бинов"""
+        power = self._np_power(channel)
+        best = 1
+        for k in range(2, self._n // 2):
+            if power[k] > power[best]:
+                best = k
+        self.dominant[channel] = best * self.resolution if power[best] > 0 else 0.0
+        nb = len(self._bins)
+        for b, k in enumerate(self._bins):
+            self._bin_power[channel * nb + b] = power[k]
+
+    def _report(self, channel: int):
+        """Заполняет strongest, freq_power, band_power канала по мощности запрошенных бинов"""
+        bins, nb = self._bins, len(self._bins)
+        offs = channel * nb
+        bp = self._bin_power
+        best = 0
+        for b in range(1, nb):
+            if bp[offs + b] > bp[offs + best]:
+                best = b
+        self.strongest[channel] = bins[best] * self.resolution if bp[offs + best] > 0 else 0.0
+        n_freq, n_band = len(self._freq_bins), len(self._band_bins)
+        for i, k in enumerate(self._freq_bins):
+            self.freq_power[channel * n_freq + i] = bp[offs + bins.index(k)]
+        for i, (lo, hi) in enumerate(self._band_bins):
+            self.band_power[channel * n_band + i] = sum(bp[offs + bins.index(lo):offs + 1 + bins.index(hi)])
+
+    def _np_power(self, channel: int):
+        """Квадрат модуля ДПФ канала channel, вычисленный с помощью ulab/NumPy"""
+        _np, x, ch, buf = self._np, self._x, self._ch, self._buf
+        # массивы MicroPython не поддерживают срезы с шагом
+        for k in range(self._n):
+            x[k] = buf[channel + ch * k]
+        x = (x - _np.mean(x)) * self._window
+        spec = _np.fft.fft(x)
+        if isinstance(spec, tuple):     # ulab без поддержки комплексных чисел возвращает (re, im)
+            re, im = spec
+            return re * re + im * im
+        return _np.abs(spec) ** 2
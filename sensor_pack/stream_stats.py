@@ -0,0 +1,243 @@
+# micropython
+# MIT license
+# Copyright (c) 2022 Roman Shevchik   goctaprog@gmail.com
+"""Потоковая (инкрементная) статистика по осям и модулю вектора: среднее, дисперсия (алгоритм Уэлфорда),
+минимум, максимум, СКЗ (RMS). Вся память выделяется в конструкторах!"""
+
+import array
+import math
+try:
+    import micropython
+except ImportError:     # CPython
+    from sensor_pack.mpy_compat import micropython
+
+
+def _float_array(size: int, value: float = 0.0) -> array.array:
+    return array.array('f', (value for _ in range(size)))
+
+
+class _Moments:
+    """Доступ к накопленной статистике по номеру канала"""
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def mean(self, channel: int) -> float:
+        return self._mean[channel]
+
+    def variance(self, channel: int) -> float:
+        if self._count < 2:
+            return 0.0
+        return max(0.0, self._m2[channel]) / (self._count - 1)
+
+    def std(self, channel: int) -> float:
+        return math.sqrt(self.variance(channel))
+
+    def min(self, channel: int) -> float:
+        return self._min[channel]
+
+    def max(self, channel: int) -> float:
+        return self._max[channel]
+
+    def rms(self, channel: int) -> float:
+        if 0 == self._count:
+            return 0.0
+        return math.sqrt(max(0.0, self._sum_sq[channel]) / self._count)
+
+    def summary(self, channel: int) -> tuple:
+        """Возвращает кортеж: количество, среднее, дисперсия, минимум, максимум, RMS"""
+        return (self._count, self.mean(channel), self.variance(channel),
+                self.min(channel), self.max(channel), self.rms(channel))
+
+
+class RunningStats(_Moments):
+    """Статистика по channels каналам, накапливаемая с момента вызова reset"""
+
+    def __init__(self, channels: int = 4):
+        self._ch = channels
+        self._mean = _float_array(channels)
+        self._m2 = _float_array(channels)      # сумма квадратов отклонений от среднего
+        self._sum_sq = _float_array(channels)  # сумма квадратов значений, для RMS
+        self._min = _float_array(channels)
+        self._max = _float_array(channels)
+        self.reset()
+
+    def reset(self):
+        self._count = 0
+        for i in range(self._ch):
+            self._mean[i] = self._m2[i] = self._sum_sq[i] = 0.0
+
+    @micropython.native
+    def update(self, values):
+        """Добавляет значения values (по одному на канал)"""
+        self._count += 1
+        n = self._count
+        mean, m2, sum_sq, mn, mx = self._mean, self._m2, self._sum_sq, self._min, self._max
+        for i in range(self._ch):
+            val = values[i]
+            delta = val - mean[i]
+            mean[i] += delta / n
+            m2[i] += delta * (val - mean[i])
+            sum_sq[i] += val * val
+            if 1 == n or val < mn[i]:
+                mn[i] = val
+            if 1 == n or val > mx[i]:
+                mx[i] = val
+
+
+class _XYZStats:
+    """Преобразует отсчет X, Y, Z в значения каналов x, y, z, модуль вектора"""
+    CHANNELS = 4    # x, y, z, модуль вектора
+
+    def __init__(self):
+        self._values = _float_array(_XYZStats.CHANNELS)
+
+    @micropython.native
+    def _expand(self, sample):
+        v = self._values
+        m2 = 0.0
+        for i in range(3):
+            val = float(sample[i])
+            v[i] = val
+            m2 += val * val
+        v[3] = math.sqrt(m2)
+        return v
+
+    def __call__(self, sample):
+        self.feed(sample)
+
+    def feed(self, sample) -> bool:
+        raise NotImplementedError
+
+
+class TumblingWindowStats(_XYZStats):
+    """Статистика по неперекрывающимся окнам из size отсчетов X, Y, Z.
+    Каналы: 0 - X, 1 - Y, 2 - Z, 3 - модуль вектора. Экземпляр можно передать в MMC5603.add_handler."""
+
+    def __init__(self, size: int):
+        super().__init__()
+        if size < 1:
+            raise ValueError(f"Invalid window size: {size}")
+        self._size = size
+        self._current = RunningStats(_XYZStats.CHANNELS)
+        # статистика последнего завершенного окна
+        self.last = RunningStats(_XYZStats.CHANNELS)
+        self.window_count = 0
+
+    def feed(self, sample) -> bool:
+        """Добавляет отсчет. Возвращает Истина, когда окно завершено и его статистика доступна в last"""
+        cur = self._current
+        cur.update(self._expand(sample))
+        if cur.count < self._size:
+            return False
+        # обмен ссылками, без выделения памяти
+        self.last, self._current = cur, self.last
+        self._current.reset()
+        self.window_count += 1
+        return True
+
+
+class SlidingWindowStats(_XYZStats, _Moments):
+    """Статистика по скользящему окну из size последних отсчетов X, Y, Z.
+    Каналы: 0 - X, 1 - Y, 2 - Z, 3 - модуль вектора. Экземпляр можно передать в MMC5603.add_handler.
+    Минимум и максимум пересчитываются просмотром окна только при вытеснении из окна экстремального значения!"""
+
+    def __init__(self, size: int):
+        super().__init__()
+        if size < 2:
+            raise ValueError(f"Invalid window size: {size}")
+        ch = _XYZStats.CHANNELS
+        self._size = size
+        self._ring = _float_array(ch * size)
+        self._head = 0
+        self._count = 0
+        self._mean = _float_array(ch)
+        self._m2 = _float_array(ch)
+        self._sum_sq = _float_array(ch)
+        self._min = _float_array(ch)
+        self._max = _float_array(ch)
+        self._evicted = _float_array(ch)    # значения, вытесненные из окна последним отсчетом
+
+    @micropython.native
+    def _rescan(self, channel: int):
+        """Пересчет минимума и максимума канала по отсчетам в окне"""
+        ch, ring, n = _XYZStats.CHANNELS, self._ring, self._count
+        start = (self._head - n) % self._size
+        offs = ch * start + channel
+        mn = mx = ring[offs]
+        for k in range(1, n):
+            val = ring[ch * ((start + k) % self._size) + channel]
+            if val < mn:
+                mn = val
+            if val > mx:
+                mx = val
+        self._min[channel] = mn
+        self._max[channel] = mx
+
+    @micropython.native
+    def _reanchor(self):
+        """Пересчет среднего, суммы квадратов отклонений и суммы квадратов по отсчетам в окне (два прохода)"""
+        ch, ring, n = _XYZStats.CHANNELS, self._ring, self._size
+        for i in range(ch):
+            total = 0.0
+            for k in range(i, ch * n, ch):
+                total += ring[k]
+            mean = total / n
+            m2 = sum_sq = 0.0
+            for k in range(i, ch * n, ch):
+                val = ring[k]
+                m2 += (val - mean) * (val - mean)
+                sum_sq += val * val
+            self._mean[i] = mean
+            self._m2[i] = m2
+            self._sum_sq[i] = sum_sq
+
+    @micropython.native
+    def feed(self, sample) -> bool:
+        """Добавляет отсчет. Возвращает Истина, когда окно заполнено.
+        После каждого полного обновления окна (size отсчетов) статистика пересчитывается по окну заново"""
+        values = self._expand(sample)
+        ch, ring = _XYZStats.CHANNELS, self._ring
+        mean, m2, sum_sq, mn, mx = self._mean, self._m2, self._sum_sq, self._min, self._max
+        evicted = self._evicted
+        offs = ch * self._head
+        full = self._count == self._size
+        for i in range(ch):
+            new = values[i]
+            if full:
+                # замена старейшего отсчета новым, размер окна не изменяется
+                old = ring[offs + i]
+                evicted[i] = old
+                delta = new - old
+                old_mean = mean[i]
+                mean[i] += delta / self._size
+                m2[i] += delta * (new - mean[i] + old - old_mean)
+                sum_sq[i] += new * new - old * old
+            else:
+                n = self._count + 1
+                delta = new - mean[i]
+                mean[i] += delta / n
+                m2[i] += delta * (new - mean[i])
+                sum_sq[i] += new * new
+            ring[offs + i] = new
+        self._head = (self._head + 1) % self._size
+        if not full:
+            self._count += 1
+        elif 0 == self._head:
+            # окно обновлено полностью. Пересчет, чтобы ошибки округления (float32) не накапливались
+            self._reanchor()
+        for i in range(ch):
+            new = values[i]
+            if 1 == self._count:
+                mn[i] = mx[i] = new
+                continue
+            if full:
+                old = evicted[i]
+                if old <= mn[i] or old >= mx[i]:
+                    self._rescan(i)     # из окна вытеснено экстремальное значение
+                    continue
+            if new < mn[i]:
+                mn[i] = new
+            if new > mx[i]:
+                mx[i] = new
+        return self._count == self._size
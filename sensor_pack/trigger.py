@@ -0,0 +1,181 @@
+# micropython
+# MIT license
+# Copyright (c) 2022 Roman Shevchik   goctaprog@gmail.com
+"""Захват событий (кратковременных изменений измеряемой величины) с сохранением истории до момента срабатывания"""
+
+import array
+try:
+    import micropython
+except ImportError:     # CPython
+    from sensor_pack.mpy_compat import micropython
+from sensor_pack.base_sensor import check_value
+
+
+class Trigger:
+    """Базовый класс условия срабатывания. Условие проверяется инкрементно, по одному отсчету за вызов"""
+    def check(self, sample, prev) -> bool:
+        """Возвращает Истина, если отсчет sample (с учетом предыдущего отсчета prev) вызывает срабатывание.
+        Для переопределения программистом!!!"""
+        raise NotImplementedError
+
+
+class MagnitudeTrigger(Trigger):
+    """Срабатывание при превышении (above is True) или снижении (above is False) модуля вектора порога threshold.
+    Сравниваются квадраты величин, без извлечения корня!"""
+    def __init__(self, threshold: int, above: bool = True):
+        self._thr2 = threshold * threshold
+        self._above = above
+
+    @micropython.native
+    def check(self, sample, prev) -> bool:
+        m2 = 0
+        for val in sample:
+            m2 += val * val
+        if self._above:
+            return m2 > self._thr2
+        return m2 < self._thr2
+
+
+class AxisThresholdTrigger(Trigger):
+    """Срабатывание при пересечении уровня level по оси axis снизу вверх (rising is True) или сверху вниз"""
+    def __init__(self, axis: int, level: int, rising: bool = True):
+        self._axis = axis
+        self._level = level
+        self._rising = rising
+
+    @micropython.native
+    def check(self, sample, prev) -> bool:
+        val, lvl = sample[self._axis], self._level
+        before = prev[self._axis]
+        if self._rising:
+            return before <= lvl < val
+        return before >= lvl > val
+
+
+class SlopeTrigger(Trigger):
+    """Срабатывание, когда модуль приращения между соседними отсчетами превышает max_delta.
+    axis - номер оси или -1 (любая ось)"""
+    def __init__(self, max_delta: int, axis: int = -1):
+        self._max_delta = max_delta
+        self._axis = axis
+
+    @micropython.native
+    def check(self, sample, prev) -> bool:
+        md = self._max_delta
+        if self._axis >= 0:
+            return abs(sample[self._axis] - prev[self._axis]) > md
+        for i in range(len(sample)):
+            if abs(sample[i] - prev[i]) > md:
+                return True
+        return False
+
+
+class EventCapture:
+    """Хранит pre_count последних отсчетов в кольцевом буфере. При срабатывании trigger 'замораживает'
+    pre_count отсчетов до срабатывания, отсчет срабатывания и post_count отсчетов после него в буфере захвата.
+    Все буферы выделяются один раз, в конструкторе. Экземпляр можно передать в MMC5603.add_handler."""
+
+    def __init__(self, trigger: Trigger, pre_count: int, post_count: int, channels: int = 3):
+        check_value(channels, range(1, 17), f"Invalid channels value: {channels}")
+        self._trigger = trigger
+        self._ch = channels
+        self._pre = pre_count
+        self._post = post_count
+        self._ring = array.array('i', bytes(4 * channels * max(1, pre_count)))
+        self._capture = array.array('i', bytes(4 * channels * (pre_count + 1 + post_count)))
+        self._prev = array.array('i', bytes(4 * channels))
+        self.rearm()
+        # количество срабатываний
+        self.trigger_count = 0
+
+    def rearm(self):
+        """Подготовка к следующему захвату. Буфер захвата становится недействительным!"""
+        self._head = 0          # индекс отсчета в кольцевом буфере для записи
+        self._ring_count = 0    # количество отсчетов в кольцевом буфере
+        self._has_prev = False
+        self._cap_count = 0     # количество отсчетов в буфере захвата
+        self._remain = 0        # количество отсчетов после срабатывания, которые осталось записать
+        self._triggered = False
+        self._done = False
+
+    @property
+    def done(self) -> bool:
+        """Истина, когда захват события завершен"""
+        return self._done
+
+    @property
+    def triggered(self) -> bool:
+        """Истина после срабатывания, до вызова rearm"""
+        return self._triggered
+
+    @property
+    def trigger_index(self) -> int:
+        """Номер отсчета срабатывания в буфере захвата"""
+        return min(self._pre, self._ring_count)
+
+    def get_capture(self) -> memoryview:
+        """Возвращает захваченные отсчеты в хронологическом порядке: x0, y0, z0, x1, y1, z1, ..."""
+        return memoryview(self._capture)[:self._ch * self._cap_count]
+
+    @micropython.native
+    def _append(self, sample):
+        """Добавляет отсчет в буфер захвата"""
+        ch, cap = self._ch, self._capture
+        offs = ch * self._cap_count
+        for i in range(ch):
+            cap[offs + i] = sample[i]
+        self._cap_count += 1
+
+    def _freeze_history(self):
+        """Копирует историю из кольцевого буфера в буфер захвата в хронологическом порядке"""
+        ch, ring, cap = self._ch, self._ring, self._capture
+        cnt = self._ring_count
+        start = (self._head - cnt) % max(1, self._pre)
+        for n in range(cnt):
+            src = ch * ((start + n) % self._pre)
+            dst = ch * n
+            for i in range(ch):
+                cap[dst + i] = ring[src + i]
+        self._cap_count = cnt
+
+    @micropython.native
+    def _push_history(self, sample):
+        """Добавляет отсчет в кольцевой буфер истории"""
+        if 0 == self._pre:
+            return
+        ch, ring = self._ch, self._ring
+        offs = ch * self._head
+        for i in range(ch):
+            ring[offs + i] = sample[i]
+        self._head = (self._head + 1) % self._pre
+        if self._ring_count < self._pre:
+            self._ring_count += 1
+
+    def feed(self, sample) -> bool:
+        """Обрабатывает очередной отсчет. Возвращает Истина, когда захват события завершен.
+        После завершения захвата отсчеты игнорируются до вызова rearm."""
+        if self._done:
+            return True
+        if self._triggered:
+            self._append(sample)
+            self._remain -= 1
+            self._done = 0 == self._remain
+            return self._done
+        prev = self._prev
+        fired = self._has_prev and self._trigger.check(sample, prev)
+        if fired:
+            self.trigger_count += 1
+            self._triggered = True
+            self._freeze_history()
+            self._append(sample)
+            self._remain = self._post
+            self._done = 0 == self._remain
+            return self._done
+        self._push_history(sample)
+        for i in range(self._ch):
+            prev[i] = sample[i]
+        self._has_prev = True
+        return False
+
+    def __call__(self, sample):
+        self.feed(sample)
@@ -0,0 +1,95 @@
+# CPython
+# MIT license
+"""Проверка записи и воспроизведения обмена драйвера MMC5603 с шиной (RecordingAdapter, ReplayAdapter)"""
+
+import array
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mmc5603mod  # noqa: E402
+from sensor_pack.bus_service import BusAdapter  # noqa: E402
+from sensor_pack.bus_trace import RecordingAdapter, ReplayAdapter  # noqa: E402
+
+
+class FakeMmc5603Bus(BusAdapter):
+    """Имитация MMC5603: ID 0x10, данные всегда готовы, результат каждого измерения новый"""
+
+    def __init__(self):
+        super().__init__(None)
+        self.regs = bytearray(0x40)
+        self.regs[0x39] = 0x10
+        self.regs[0x18] = 0b0100_0000   # Meas_m_done
+        self._sample = 0
+
+    def read_register(self, device_addr: int, reg_addr: int, bytes_count: int) -> bytes:
+        return bytes(self.regs[reg_addr:reg_addr + bytes_count])
+
+    def write_register(self, device_addr: int, reg_addr: int, value, bytes_count: int, byte_order: str):
+        data = value.to_bytes(bytes_count, byte_order) if isinstance(value, int) else value
+        self.regs[reg_addr:reg_addr + len(data)] = data
+
+    def read_buf_from_mem(self, device_addr: int, mem_addr, buf):
+        self._sample += 1
+        for i in range(len(buf)):
+            buf[i] = (mem_addr + i + 17 * self._sample) & 0xFF
+
+    def write_buf_to_mem(self, device_addr: int, mem_addr, buf):
+        data = bytes(buf)
+        self.regs[mem_addr:mem_addr + len(data)] = data
+
+
+def run_driver(adapter: BusAdapter, update_rate: int = 20, count: int = 5) -> list:
+    """Типичная работа приложения: настройка датчика и чтение count результатов"""
+    sensor = mmc5603mod.MMC5603(adapter)
+    assert 0x10 == sensor.get_id()
+    sensor.set_update_rate(update_rate)
+    sensor.start_measure(continuous_mode=True)
+    return [next(sensor) for _ in range(count)]
+
+
+def record(update_rate: int = 20) -> tuple:
+    """Возвращает (трасса, результаты измерений)"""
+    stream = io.BytesIO()
+    results = run_driver(RecordingAdapter(FakeMmc5603Bus(), stream), update_rate)
+    return stream.getvalue(), results
+
+
+class TestRecordReplay(unittest.TestCase):
+    def test_replay_reproduces_driver_results(self):
+        trace, expected = record()
+        replay = ReplayAdapter(trace)
+        self.assertEqual(expected, run_driver(replay))
+        self.assertTrue(replay.at_end)
+
+    def test_strict_replay_detects_wrong_register_write(self):
+        trace, _ = record(update_rate=20)
+        with self.assertRaises(ValueError):
+            run_driver(ReplayAdapter(trace), update_rate=5)
+
+    def test_non_strict_replay_ignores_written_data(self):
+        trace, expected = record(update_rate=20)
+        self.assertEqual(expected, run_driver(ReplayAdapter(trace, strict=False), update_rate=5))
+
+    def test_non_byte_buffers_keep_trace_in_sync(self):
+        stream = io.BytesIO()
+        rec = RecordingAdapter(FakeMmc5603Bus(), stream)
+        rec.write_buf_to_mem(0x30, 0x20, array.array('H', (0x1234, 0x5678)))
+        words = array.array('H', (0, 0))
+        rec.read_buf_from_mem(0x30, 0x00, words)
+        self.assertEqual(b'\x10', rec.read_register(0x30, 0x39, 1))
+
+        replay = ReplayAdapter(stream.getvalue())
+        replay.write_buf_to_mem(0x30, 0x20, array.array('H', (0x1234, 0x5678)))
+        replayed = array.array('H', (0, 0))
+        replay.read_buf_from_mem(0x30, 0x00, replayed)
+        self.assertEqual(words, replayed)
+        self.assertEqual(b'\x10', replay.read_register(0x30, 0x39, 1))
+        self.assertTrue(replay.at_end)
+
+
+if __name__ == "__main__":
+    unittest.main()
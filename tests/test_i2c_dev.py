@@ -0,0 +1,100 @@
+# CPython, Linux
+# MIT license
+"""Проверка LinuxI2cAdapter с имитацией ioctl ядра (без устройства /dev/i2c-N)"""
+
+import array
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sensor_pack.i2c_dev import LinuxI2cAdapter, I2C_RDWR, I2C_M_RD  # noqa: E402
+
+
+class FakeI2cDevice:
+    """Имитация ядра и устройства с 256 регистрами и автоинкрементом адреса регистра"""
+
+    def __init__(self, address: int = 0x30):
+        self.address = address
+        self.regs = bytearray(range(256))
+        self.ptr = 0
+        self.transactions = []  # список транзакций: [(addr, read, length), ...]
+
+    def __call__(self, fd, request, data):
+        assert I2C_RDWR == request
+        log = []
+        for i in range(data.nmsgs):
+            msg = data.msgs[i]
+            if msg.addr != self.address:
+                raise OSError(6, "ENXIO")
+            read = bool(msg.flags & I2C_M_RD)
+            log.append((msg.addr, read, msg.len))
+            if read:
+                for k in range(msg.len):
+                    msg.buf[k] = self.regs[(self.ptr + k) & 0xFF]
+                continue
+            self.ptr = msg.buf[0]
+            for k in range(1, msg.len):
+                self.regs[(self.ptr + k - 1) & 0xFF] = msg.buf[k]
+        self.transactions.append(log)
+
+
+class TestLinuxI2cAdapter(unittest.TestCase):
+    def setUp(self):
+        self.dev = FakeI2cDevice()
+        self.adapter = LinuxI2cAdapter(ioctl_func=self.dev)
+
+    def test_read_register_is_one_combined_transaction(self):
+        self.assertEqual(b'\x39\x3a', self.adapter.read_register(0x30, 0x39, 2))
+        self.assertEqual([[(0x30, False, 1), (0x30, True, 2)]], self.dev.transactions)
+
+    def test_read_buf_from_mem_into_writable_buffers(self):
+        for buf in (bytearray(4), array.array('B', bytes(4)), memoryview(bytearray(4))):
+            self.adapter.read_buf_from_mem(0x30, 0x10, buf)
+            self.assertEqual(b'\x10\x11\x12\x13', bytes(buf))
+
+    def test_read_into_readonly_buffer_raises(self):
+        with self.assertRaises(TypeError):
+            self.adapter.read_buf_from_mem(0x30, 0x10, b'\x00\x00')
+
+    def test_write_register_and_buf(self):
+        self.adapter.write_register(0x30, 0x1A, 0x1234, 2, 'big')
+        self.adapter.write_buf_to_mem(0x30, 0x1E, b'\x01\x02\x03')
+        self.assertEqual(b'\x12\x34', bytes(self.dev.regs[0x1A:0x1C]))
+        self.assertEqual(b'\x01\x02\x03', bytes(self.dev.regs[0x1E:0x21]))
+
+    def test_caller_buffer_is_released_after_transfer(self):
+        buf = bytearray(2)
+        self.adapter.read_buf_from_mem(0x30, 0x10, buf)
+        self.adapter.transfer(((0x30, False, b'\x20'), (0x30, True, buf)))
+        with self.assertRaises(OSError):
+            self.adapter.read_buf_from_mem(0x31, 0x10, buf)
+        buf.extend(b'\x00')     # BufferError, если адаптер удерживает буфер
+        self.assertEqual(b'\x20\x21\x00', bytes(buf))
+
+    def test_write_non_byte_buffer(self):
+        words = array.array('H', (0x0102, 0x0304))
+        self.adapter.write_buf_to_mem(0x30, 0x20, words)
+        self.assertEqual(bytes(words), bytes(self.dev.regs[0x20:0x24]))
+        self.assertEqual(0x24, self.dev.regs[0x24])
+        self.assertEqual(bytes(words), self.adapter.read_register(0x30, 0x20, 4))
+
+    def test_transfer_batch(self):
+        buf = bytearray(3)
+        self.adapter.transfer(((0x30, False, b'\x05'), (0x30, True, buf)))
+        self.assertEqual(b'\x05\x06\x07', bytes(buf))
+        with self.assertRaises(ValueError):
+            self.adapter.transfer(tuple((0x30, False, b'\x00') for _ in range(9)))
+
+    def test_bus_error_propagates(self):
+        with self.assertRaises(OSError):
+            self.adapter.read_register(0x31, 0x00, 1)
+
+    def test_max_msgs_validation(self):
+        with self.assertRaises(ValueError):
+            LinuxI2cAdapter(max_msgs=1, ioctl_func=self.dev)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# CPython
+# MIT license
+"""Проверка целочисленной реализации алгоритма Гёрцеля SpectralAnalyzer по эталонному ДПФ"""
+
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sensor_pack.spectral import SpectralAnalyzer  # noqa: E402
+
+_FS = 1000      # частота отсчетов, Гц
+_OFFSET = 1 << 19
+
+
+def reference_power(samples, k: int) -> float:
+    """Квадрат модуля бина k ДПФ отсчетов samples без среднего, с окном Ханна (как в SpectralAnalyzer)"""
+    n = len(samples)
+    mean = sum(samples) / n
+    re = im = 0.0
+    for i, x in enumerate(samples):
+        v = (x - mean) * (0.5 - 0.5 * math.cos(2 * math.pi * i / (n - 1)))
+        re += v * math.cos(2 * math.pi * k * i / n)
+        im -= v * math.sin(2 * math.pi * k * i / n)
+    return re * re + im * im
+
+
+def tone(n: int, amplitude: float, freq: float):
+    """'Сырые' отсчеты синусоиды, первый отсчет равен постоянной составляющей"""
+    return [int(round(_OFFSET + amplitude * math.sin(2 * math.pi * freq * i / _FS))) for i in range(n)]
+
+
+class TestFixedPointGoertzel(unittest.TestCase):
+    def check_tone(self, n: int, amplitude: float, freq: float = 50):
+        samples = tone(n, amplitude, freq)
+        analyzer = SpectralAnalyzer(n, _FS, frequencies=(freq,), channels=1, use_numpy=False)
+        for x in samples:
+            analyzer.feed((x,))
+        expected = reference_power(samples, analyzer._to_bin(freq))
+        self.assertAlmostEqual(1.0, analyzer.freq_power[0] / expected, delta=0.01,
+                               msg=f"n={n}, amplitude={amplitude}")
+
+    def test_small_amplitudes(self):
+        for n in (200, 1000):
+            for amplitude in (1, 8, 16, 64, 400):
+                self.check_tone(n, amplitude)
+
+    def test_large_amplitude(self):
+        self.check_tone(1000, 16000, 60)
+
+    def test_constant_input_has_zero_power(self):
+        analyzer = SpectralAnalyzer(200, _FS, channels=1, use_numpy=False)
+        for _ in range(200):
+            analyzer.feed((_OFFSET,))
+        self.assertEqual(0.0, analyzer.freq_power[0])
+        self.assertEqual(0.0, analyzer.strongest[0])
+
+    def test_state_stays_small_int(self):
+        n = 1000
+        analyzer = SpectralAnalyzer(n, _FS, frequencies=(50,), channels=1, use_numpy=False)
+        peak = 0
+        for i in range(n):
+            analyzer.feed((_OFFSET + (16384 if math.sin(2 * math.pi * 20 * i / _FS) >= 0 else -16384),))
+            peak = max(peak, max(abs(s) for s in analyzer._s1))
+        self.assertLess(peak, 1 << 28)
+
+
+if __name__ == "__main__":
+    unittest.main()